@@ -1,4 +1,298 @@
 import numpy as np
+import bz2
+import gzip
+import json
+import lzma
+import glob
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, wait
+from itertools import islice
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+from summary import DatasetSummary
+
+# extensões reconhecidas quando compression='infer'
+_COMPRESSION_EXT = {'.gz': 'gzip', '.xz': 'xz', '.bz2': 'bz2', '.zst': 'zstd'}
+
+
+def _count_lines(filename, block_size=1 << 20):
+    # Contar as linhas do ficheiro lendo blocos binários, sem guardar o conteúdo em memória
+    n_lines = 0
+    last = b'\n'
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            n_lines += block.count(b'\n')
+            last = block[-1:]
+    # a última linha pode não terminar com '\n'
+    if last != b'\n':
+        n_lines += 1
+    return n_lines
+
+def _infer_kind(col):
+    # Uma coluna é numérica se todos os valores não vazios puderem ser convertidos em float, caso contrário é categórica
+    try:
+        col[col != ''].astype(np.float64)
+        return 'num'
+    except ValueError:
+        return 'cat'
+
+def _parse_chunks(f, sep, chunksize, header, kinds=None):
+    # Ler o ficheiro em blocos de 'chunksize' linhas e devolver cada bloco como uma matriz de texto
+    # Os tipos das colunas são inferidos a partir do primeiro bloco (se não forem dados); uma coluna numérica
+    # que tenha texto num bloco seguinte é detetada quando o bloco é guardado (_ColumnBuffers.store)
+    while True:
+        lines = list(islice(f, chunksize))
+        if not lines:
+            return
+        rows = [line.rstrip('\r\n').split(sep) for line in lines if line.strip()]
+        if not rows:
+            continue
+        if any(len(row) != len(header) for row in rows):
+            raise ValueError(f'Todas as linhas devem ter {len(header)} colunas.')
+        chunk = np.array(rows)
+        if kinds is None:
+            kinds = [_infer_kind(chunk[:, j]) for j in range(chunk.shape[1])]
+        yield chunk, kinds
+
+class _NonNumericColumn(ValueError):
+    # Uma coluna inferida como numérica tem texto depois de já haver linhas guardadas: a leitura é repetida com a coluna categórica
+    # (read_csv relê o ficheiro, read_csv_shards relê os ficheiros com os blocos partilhados criados de novo)
+    def __init__(self, column):
+        super().__init__(column)
+        self.column = column
+
+    def __str__(self):
+        return f'A coluna {self.column} tem valores não numéricos.'
+
+def _store_float(col, out):
+    # Converter uma coluna de texto para float64 diretamente no buffer 'out' (valores vazios ficam NaN)
+    # Levanta ValueError se algum valor não for numérico
+    mask = col != ''
+    out[~mask] = np.nan
+    out[mask] = col[mask].astype(np.float64)
+
+def _label_dtype(col):
+    # Tipo de texto com a largura do maior valor da coluna da saída (e não da maior célula do bloco)
+    width = int(np.char.str_len(col).max()) if len(col) else 1
+    return np.dtype(f'<U{max(width, 1)}')
+
+def _store_codes(col, out, table):
+    # Converter uma coluna de texto em códigos inteiros diretamente no buffer 'out'
+    # 'table' é o dicionário valor -> código da coluna, partilhado por todos os blocos; valores vazios ficam com o código -1
+    # Os códigos novos são dados pela ordem da primeira ocorrência, por isso as categorias não dependem do tamanho dos blocos
+    values, first, inverse = np.unique(col, return_index=True, return_inverse=True)
+    lut = np.empty(len(values), dtype=np.int32)
+    for k in np.argsort(first, kind='stable'):
+        lut[k] = table.setdefault(values[k], len(table)) if values[k] != '' else -1
+    out[:] = lut[inverse]
+
+def _fit_width(buf, dtype):
+    # Os buffers de texto só são realocados quando aparece um valor maior do que os anteriores
+    if dtype.itemsize > buf.dtype.itemsize:
+        return buf.astype(dtype)
+    return buf
+
+def _narrow_label(y):
+    # Uma saída numérica só com valores inteiros (e sem vazios) é guardada como int64
+    if y.dtype.kind == 'f' and len(y) > 0 and not np.isnan(y).any() and np.all(y == np.floor(y)):
+        return y.astype(np.int64)
+    return y
+
+def _as_columns(block, dtype):
+    # Manter o bloco (e o seu tipo, p.ex. np.memmap) se cada coluna já for contígua, senão copiar para ordem Fortran
+    block = np.asanyarray(block)
+    if block.dtype == dtype and (block.shape[0] <= 1 or block.strides[0] == block.itemsize):
+        return block
+    return np.asfortranarray(block, dtype=dtype)
+
+def _positions(kinds):
+    # Posição de cada feature dentro do seu bloco (numérico ou categórico)
+    counters = {'num': 0, 'cat': 0}
+    pos = []
+    for kind in kinds:
+        pos.append(counters[kind])
+        counters[kind] += 1
+    return pos
+
+
+def _open_output(filename, compression, buffer_size):
+    # Abrir o ficheiro de saída em modo binário, com um buffer grande ou através de um compressor
+    if compression == 'infer':
+        compression = _COMPRESSION_EXT.get(os.path.splitext(filename)[1])
+    if compression is None:
+        return open(filename, 'wb', buffering=buffer_size)
+    if compression == 'gzip':
+        return gzip.open(filename, 'wb', compresslevel=6)
+    if compression == 'xz':
+        return lzma.open(filename, 'wb')
+    if compression == 'bz2':
+        return bz2.open(filename, 'wb')
+    if compression == 'zstd':
+        if zstandard is None:
+            raise ImportError('A compressão zstd precisa do pacote "zstandard".')
+        return zstandard.open(filename, 'wb')
+    raise ValueError(f'Compressão inválida: {compression}')
+
+def _format_column(col, float_format):
+    # Devolve o formato e os valores de uma coluna para a formatação com o operador %:
+    # inteiros com '%d', reais com float_format e colunas com vazios já formatadas em texto (vazios ficam '')
+    if col.dtype.kind in 'biu':
+        return '%d', col
+    if col.dtype.kind != 'f':
+        return '%s', col.astype(str)
+    nulls = np.isnan(col)
+    values = col[~nulls]
+    fmt = '%d' if np.all(values == np.floor(values)) and np.all(np.abs(values) < 2 ** 53) else float_format
+    if not nulls.any():
+        return fmt, col.astype(np.int64) if fmt == '%d' else col
+    text = np.zeros(len(col), dtype=object)
+    text[:] = ''
+    text[~nulls] = [fmt % v for v in values.tolist()]
+    return '%s', text
+
+def _format_block(ds, start, end, sep, float_format):
+    # Formatar as linhas [start, end) de uma só vez: cada coluna é convertida em bloco e todas as linhas
+    # são geradas com uma única operação de formatação ('fmt' repetido para cada linha)
+    columns = []
+    for j, kind in enumerate(ds._kinds):
+        if kind == 'num':
+            columns.append(_format_column(ds._num[start:end, ds._pos[j]], float_format))
+        else:
+            codes = ds._codes[start:end, ds._pos[j]]
+            columns.append(('%s', np.append(ds.categories[j], '')[codes]))
+    if ds.y is not None:
+        columns.append(_format_column(np.asarray(ds.y[start:end]), float_format))
+    cells = np.empty((end - start, len(columns)), dtype=object)
+    for i, (_, values) in enumerate(columns):
+        cells[:, i] = values
+    fmt = sep.join(fmt for fmt, _ in columns) + '\n'
+    return ((fmt * (end - start)) % tuple(cells.ravel().tolist())).encode('utf-8')
+
+
+class _ColumnBuffers:
+    # Buffers pré-alocados onde o leitor de CSV escreve cada bloco já convertido:
+    # um bloco float64 com as features numéricas, um bloco int32 com os códigos das categóricas e o vetor y
+    # promote: uma coluna numérica com texto no primeiro bloco guardado passa a categórica (acontece no iter_csv, que cria buffers
+    # novos para cada bloco). Se já houver linhas guardadas, ou se promote for False (blocos em memória partilhada),
+    # levanta _NonNumericColumn: o texto original dessas linhas já se perdeu e quem lê o ficheiro repete a leitura
+
+    def __init__(self, chunk, kinds, header, n_rows, num=None, codes=None, promote=True):
+        self.kinds = list(kinds[:-1])
+        self.y_kind = kinds[-1]
+        self.header = header
+        self.promote = promote
+        self.pos = _positions(self.kinds)
+        n_num = self.kinds.count('num')
+        # ordem Fortran para que cada coluna seja contígua em memória (num e codes podem ser dados já alocados, p.ex. em memória partilhada)
+        self.num = np.empty((n_rows, n_num), dtype=np.float64, order='F') if num is None else num
+        self.codes = np.empty((n_rows, len(self.kinds) - n_num), dtype=np.int32, order='F') if codes is None else codes
+        # dicionário valor -> código de cada feature categórica (indexado pelo índice da feature)
+        self.tables = {j: {} for j, kind in enumerate(self.kinds) if kind == 'cat'}
+        self.y = np.empty(n_rows, dtype=np.float64 if self.y_kind == 'num' else _label_dtype(chunk[:, -1]))
+        self.n = 0
+
+    @property
+    def all_kinds(self):
+        # Tipos das features e da saída (podem ter mudado com blocos anteriores)
+        return self.kinds + [self.y_kind]
+
+    def store(self, chunk):
+        # Escrever um bloco de texto nas linhas [n, n + len(chunk)) dos buffers
+        start, end = self.n, self.n + chunk.shape[0]
+        for j, kind in enumerate(self.kinds):
+            if kind == 'num':
+                try:
+                    _store_float(chunk[:, j], self.num[start:end, self.pos[j]])
+                    continue
+                except ValueError:
+                    self._to_categorical(j, start, end)
+            _store_codes(chunk[:, j], self.codes[start:end, self.pos[j]], self.tables[j])
+        if self.y_kind == 'num':
+            try:
+                _store_float(chunk[:, -1], self.y[start:end])
+            except ValueError:
+                if not self.promote or start > 0:
+                    raise _NonNumericColumn(len(self.kinds))
+                self.y_kind = 'cat'
+                self.y = np.empty(len(self.y), dtype=_label_dtype(chunk[:, -1]))
+        if self.y_kind == 'cat':
+            self.y = _fit_width(self.y, _label_dtype(chunk[:, -1]))
+            self.y[start:end] = chunk[:, -1]
+        self.n = end
+
+    def _to_categorical(self, j, start, end):
+        # A feature j (numérica até agora) tem texto no primeiro bloco: passa para o bloco dos códigos.
+        # Os blocos são realocados; as outras colunas são copiadas até 'end' porque as anteriores a j já têm o bloco atual
+        if not self.promote or start > 0:
+            raise _NonNumericColumn(j)
+        old_pos = self.pos
+        self.kinds[j] = 'cat'
+        self.pos = _positions(self.kinds)
+        n_rows = self.num.shape[0]
+        num = np.empty((n_rows, self.kinds.count('num')), dtype=np.float64, order='F')
+        codes = np.empty((n_rows, self.kinds.count('cat')), dtype=np.int32, order='F')
+        for k, kind in enumerate(self.kinds):
+            if k == j:
+                continue
+            if kind == 'num':
+                num[:end, self.pos[k]] = self.num[:end, old_pos[k]]
+            else:
+                codes[:end, self.pos[k]] = self.codes[:end, old_pos[k]]
+        self.num, self.codes = num, codes
+        self.tables[j] = {}
+
+    def to_dataset(self, ds):
+        # Passar os buffers para o Dataset (descartando as posições pré-alocadas para linhas vazias)
+        n = self.n
+        categories = {}
+        for j, kind in enumerate(self.kinds):
+            if kind == 'cat':
+                categories[j] = np.array(list(self.tables[j]), dtype=str)
+        ds._set_columns(self.kinds, self.num[:n], self.codes[:n], categories)
+        ds.y = _narrow_label(self.y[:n])
+        ds.features_names = self.header[:-1]
+        ds.label = self.header[-1]
+        return ds
+
+
+def _scan_shard(path, sep, sample_size):
+    # 1ª fase da leitura de vários ficheiros: cabeçalho, número de linhas e tipos das colunas (inferidos nas primeiras linhas)
+    with open(path, 'r') as f:
+        header = f.readline().rstrip('\r\n').split(sep)
+        kinds = next((kinds for _, kinds in _parse_chunks(f, sep, sample_size, header)), None)
+    return header, max(_count_lines(path) - 1, 0), kinds, os.path.getsize(path)
+
+def _shared_block(path, n_rows, n_cols, dtype, mode):
+    # Bloco em ordem Fortran num ficheiro mapeado em memória, partilhado entre o processo principal e os workers
+    if n_rows == 0 or n_cols == 0:
+        return np.empty((n_rows, n_cols), dtype=dtype, order='F')
+    return np.memmap(path, dtype=dtype, mode=mode, shape=(n_rows, n_cols), order='F')
+
+def _load_shard(path, sep, chunksize, kinds, header, start, n_rows, shared):
+    # 2ª fase: cada worker escreve as linhas do seu ficheiro diretamente nas linhas [start, start + n_rows) dos blocos partilhados
+    num = _shared_block(shared['num'], shared['n_rows'], kinds[:-1].count('num'), np.float64, 'r+')
+    codes = _shared_block(shared['codes'], shared['n_rows'], kinds[:-1].count('cat'), np.int32, 'r+')
+    buffers = None
+    with open(path, 'r') as f:
+        f.readline()
+        for chunk, _ in _parse_chunks(f, sep, chunksize, header, kinds):
+            if buffers is None:
+                buffers = _ColumnBuffers(chunk, kinds, header, n_rows, num[start:start + n_rows], codes[start:start + n_rows],
+                                         promote=False)
+            buffers.store(chunk)
+    if isinstance(num, np.memmap):
+        num.flush()
+    if isinstance(codes, np.memmap):
+        codes.flush()
+    if buffers is None:
+        return 0, [], np.empty(0)
+    # os códigos das categorias são locais ao ficheiro, o processo principal converte-os para códigos globais
+    return buffers.n, [list(buffers.tables[j]) for j in sorted(buffers.tables)], buffers.y[:buffers.n]
+
+
 class Dataset:
 
     #X -> matriz com as variáveis de entrada (pensar como tratar as variáveis de tipos distintos)
@@ -7,14 +301,71 @@ class Dataset:
     #label -> string com o nome da label (atributo saída)
 
     def __init__(self, X=None, y=None, features_names=None, label=None):
+        # As features são guardadas por colunas e com tipo:
+        #   - _num: matriz float64 (ordem Fortran) com as features numéricas, valores vazios são NaN
+        #   - _codes: matriz int32 (ordem Fortran) com os códigos das features categóricas, valores vazios são -1
+        #   - categories: dicionário índice da feature -> vetor com as categorias (o código é a posição no vetor)
+        #   - _nulls: uma máscara de bits por feature (np.packbits) que indica as linhas com valores vazios
         self.X = X
         self.y = y
         self.features_names = features_names
         self.label = label
-        
+
+    @property
+    def X(self):
+        return self.get_X()
+
+    @X.setter
+    def X(self, X):
+        self.set_X(X)
+
     def set_X(self, X):
-        self.X = X
-        
+        # Converter a matriz X para o formato por colunas, inferindo o tipo de cada coluna
+        if X is None:
+            self._set_columns([], np.empty((0, 0)), np.empty((0, 0), dtype=np.int32), {})
+            self._n = None
+            return
+        X = np.asarray(X)
+        if X.dtype.kind in 'biuf':
+            self._set_columns(['num'] * X.shape[1], X, np.empty((X.shape[0], 0), dtype=np.int32), {})
+            return
+        X = X.astype(str)
+        kinds = [_infer_kind(X[:, j]) for j in range(X.shape[1])]
+        pos = _positions(kinds)
+        num = np.empty((X.shape[0], kinds.count('num')), dtype=np.float64, order='F')
+        codes = np.empty((X.shape[0], kinds.count('cat')), dtype=np.int32, order='F')
+        categories = {}
+        for j, kind in enumerate(kinds):
+            if kind == 'num':
+                _store_float(X[:, j], num[:, pos[j]])
+            else:
+                table = {}
+                _store_codes(X[:, j], codes[:, pos[j]], table)
+                categories[j] = np.array(list(table), dtype=str)
+        self._set_columns(kinds, num, codes, categories)
+
+    def _set_columns(self, kinds, num, codes, categories, nulls=None):
+        self._kinds = list(kinds)
+        self._pos = _positions(self._kinds)
+        self._num = _as_columns(num, np.float64)
+        self._codes = _as_columns(codes, np.int32)
+        self.categories = categories
+        self._n = self._num.shape[0] if self._num.shape[1] else self._codes.shape[0]
+        if nulls is None:
+            self._update_nulls()
+        else:
+            self._nulls = nulls
+
+    def _update_nulls(self):
+        # Uma máscara de bits por coluna (8 linhas por byte)
+        n_bytes = (self._n + 7) // 8 if self._n else 0
+        self._nulls = np.zeros((len(self._kinds), n_bytes), dtype=np.uint8)
+        for j, kind in enumerate(self._kinds):
+            if kind == 'num':
+                self._nulls[j] = np.packbits(np.isnan(self._num[:, self._pos[j]]))
+            else:
+                self._nulls[j] = np.packbits(self._codes[:, self._pos[j]] < 0)
+
     def set_y(self, y):
         self.y = y
         
@@ -24,9 +375,41 @@ class Dataset:
     def set_label(self, label):
         self.y = label
         
-    def get_X(self):
-        return self.X
-    
+    def get_X(self, columns=None):
+        # Devolve as features pedidas (todas por omissão)
+        # Se forem todas numéricas e estiverem espaçadas de forma regular no bloco numérico, é devolvida uma vista (sem cópia)
+        if self._n is None:
+            return None
+        if columns is None:
+            columns = range(len(self._kinds))
+        columns = list(columns)
+        kinds = [self._kinds[j] for j in columns]
+        if all(kind == 'num' for kind in kinds):
+            pos = [self._pos[j] for j in columns]
+            steps = np.diff(pos)
+            if len(pos) == 0:
+                return self._num[:, :0]
+            if len(pos) == 1 or (steps[0] > 0 and np.all(steps == steps[0])):
+                step = steps[0] if len(pos) > 1 else 1
+                return self._num[:, pos[0]:pos[-1] + 1:step]
+            return self._num[:, pos]
+        # Com features categóricas é preciso descodificar as categorias (valores vazios ficam '')
+        decoded = [self._decode(j) if kind == 'cat' else self._num[:, self._pos[j]] for j, kind in zip(columns, kinds)]
+        if all(kind == 'cat' for kind in kinds):
+            return np.column_stack(decoded)
+        X = np.empty((self._n, len(columns)), dtype=object)
+        for i, col in enumerate(decoded):
+            X[:, i] = col
+        return X
+
+    def _decode(self, j):
+        # O código -1 (vazio) indexa o último elemento, que é a string vazia
+        return np.append(self.categories[j], '')[self._codes[:, self._pos[j]]]
+
+    def get_null_mask(self, j):
+        # Vetor booleano com as linhas em que a feature j está vazia
+        return np.unpackbits(self._nulls[j], count=self._n).astype(bool)
+
     def get_y(self):
         return self.y
     
@@ -36,171 +419,274 @@ class Dataset:
     def get_label(self):
         return self.label
             
-    def read_csv(self, filename):
+    def read_csv(self, filename, sep=',', chunksize=100000):
         try:
-            #abrir o ficheiro CSV em modo leitura, with é usado para garantir que o ficheiro é fechado automaticamente depois da leitura
+            #contar as linhas primeiro (leitura binária por blocos) para poder pré-alocar os buffers
+            n_rows = max(_count_lines(filename) - 1, 0)
             with open(filename, 'r') as f:
-                #armazenar as linhas na lista 'lines'
-                lines = f.readlines()
-                #strip() é usado para remover caracteres em branco do início e do fim de cada linha
-                #split(',') divide cada linha numa lista de valores separados por vírgulas 
-                #assim, 'data' guarda os dados do ficheiro CSV numa matriz, excluindo a primeira linha (que contém os nomes das colunas)
-                data = [line.strip().split(',') for line in lines[1:]]
-                #guardar os nomes das colunas numa lista, exceto o nome da última que é o nome da variável de saída
-                self.features_names = lines[0].strip().split(',')[:-1]
-                #guardar nome da variável de saída
-                self.label =  lines[0].strip().split(',')[-1]
-            #definir X e y:
-            self.X = np.array(data)[:, :-1]
-            self.y = np.array(data)[:, -1]
+                #a primeira linha tem os nomes das colunas, a última coluna é a variável de saída
+                header = f.readline().rstrip('\r\n').split(sep)
+                kinds = None
+                while True:
+                    buffers = None
+                    #o ficheiro é lido em blocos de 'chunksize' linhas, cada bloco é escrito diretamente nos buffers pré-alocados
+                    try:
+                        for chunk, chunk_kinds in _parse_chunks(f, sep, chunksize, header, kinds):
+                            if buffers is None:
+                                buffers = _ColumnBuffers(chunk, chunk_kinds, header, n_rows)
+                            buffers.store(chunk)
+                        break
+                    except _NonNumericColumn as e:
+                        #uma coluna numérica tem texto depois do primeiro bloco: o ficheiro é lido de novo com a coluna categórica,
+                        #para que as categorias venham do texto original e não dependam do chunksize
+                        kinds = buffers.all_kinds
+                        kinds[e.column] = 'cat'
+                        f.seek(0)
+                        f.readline()
+            if buffers is None:
+                self.X = np.empty((0, len(header) - 1))
+                self.y = np.empty(0)
+                self.features_names = header[:-1]
+                self.label = header[-1]
+            else:
+                buffers.to_dataset(self)
         except FileNotFoundError:
             print(f'Ficheiro "{filename}" não encontrado.')
 
-   
-    def write_csv(self, filename):
+    def iter_csv(self, filename, sep=',', chunksize=100000):
+        # Modo iterador: devolve um Dataset por cada bloco de 'chunksize' linhas (para processar ficheiros maiores que a memória)
+        # Os dicionários de categorias são partilhados entre blocos, por isso os códigos são os mesmos em todos os blocos
+        # Uma coluna numérica que tenha texto num bloco passa a categórica nesse bloco e nos seguintes
+        # (os blocos já devolvidos não mudam)
+        with open(filename, 'r') as f:
+            header = f.readline().rstrip('\r\n').split(sep)
+            tables = None
+            kinds = None
+            for chunk, first_kinds in _parse_chunks(f, sep, chunksize, header):
+                buffers = _ColumnBuffers(chunk, kinds or first_kinds, header, chunk.shape[0])
+                if tables is not None:
+                    buffers.tables = tables
+                tables = buffers.tables
+                buffers.store(chunk)
+                kinds = buffers.all_kinds
+                yield buffers.to_dataset(Dataset())
+
+    def read_csv_shards(self, paths, sep=',', n_workers=None, chunksize=100000, worker_memory=None):
+        # Ler vários ficheiros CSV com o mesmo cabeçalho (lista de caminhos ou padrão glob, p.ex. 'dados/*.csv') para um único Dataset
+        # Os ficheiros são lidos em paralelo por 'n_workers' processos, que escrevem diretamente num bloco pré-alocado em memória partilhada
+        # worker_memory: memória aproximada (bytes) que cada worker pode usar por bloco; se for dado substitui o chunksize
+        # Ficheiros com cabeçalhos diferentes levantam ValueError. Os tipos das colunas não têm de coincidir: uma coluna numérica
+        # num ficheiro e com texto noutro passa a categórica (o resultado é o mesmo de read_csv sobre os ficheiros concatenados)
+        if isinstance(paths, str):
+            paths = sorted(glob.glob(paths))
+        if len(paths) == 0:
+            raise ValueError('Nenhum ficheiro para ler.')
+        n_workers = n_workers or os.cpu_count()
+
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            # 1ª fase: cabeçalhos, tipos e número de linhas de cada ficheiro (para validar o esquema e pré-alocar)
+            scans = list(pool.map(_scan_shard, paths, [sep] * len(paths), [min(chunksize, 10000)] * len(paths)))
+            header, _, kinds, _ = scans[0]
+            for path, (shard_header, n_rows, shard_kinds, _) in zip(paths, scans):
+                if shard_header != header:
+                    raise ValueError(f'O cabeçalho de "{path}" é diferente do cabeçalho de "{paths[0]}".')
+                # uma coluna é categórica se for categórica em algum dos ficheiros (não é um erro, como no texto tardio de read_csv)
+                if kinds is None:
+                    kinds = shard_kinds
+                elif shard_kinds is not None:
+                    kinds = ['cat' if 'cat' in pair else 'num' for pair in zip(kinds, shard_kinds)]
+            if kinds is None:
+                self.X, self.y = np.empty((0, len(header) - 1)), np.empty(0)
+                self.features_names, self.label = header[:-1], header[-1]
+                return
+            if worker_memory is not None:
+                # estimativa: cada byte do ficheiro ocupa ~8 bytes depois de separado em strings numpy (4 bytes por carácter, mais as cópias)
+                line_bytes = sum(size for *_, size in scans) / max(sum(n for _, n, _, _ in scans), 1)
+                chunksize = max(int(worker_memory // (8 * max(line_bytes, 1))), 1)
+
+            sizes = [n_rows for _, n_rows, _, _ in scans]
+            starts = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(int).tolist()
+            total = int(sum(sizes))
+            # os blocos partilhados ficam em /dev/shm (memória) quando existe
+            tmpdir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+            while True:
+                # ficheiros novos em cada tentativa: os de uma tentativa anterior nunca são truncados nem reutilizados
+                shared = {'n_rows': total}
+                for name in ('num', 'codes'):
+                    fd, shared[name] = tempfile.mkstemp(prefix=f'dataset_{name}_', dir=tmpdir)
+                    os.close(fd)
+                futures = []
+                try:
+                    num = _shared_block(shared['num'], total, kinds[:-1].count('num'), np.float64, 'w+')
+                    codes = _shared_block(shared['codes'], total, kinds[:-1].count('cat'), np.int32, 'w+')
+                    # 2ª fase: leitura em paralelo. Espera-se por todos os ficheiros, mesmo que um deles falhe,
+                    # para nenhum worker continuar a escrever nos blocos partilhados depois de a tentativa acabar
+                    futures = [pool.submit(_load_shard, path, sep, chunksize, kinds, header, start, n_rows, shared)
+                               for path, start, n_rows in zip(paths, starts, sizes)]
+                    wait(futures)
+                finally:
+                    # o mapeamento continua válido depois de apagar os ficheiros (a memória é libertada com os arrays)
+                    for name in ('num', 'codes'):
+                        try:
+                            os.unlink(shared[name])
+                        except OSError:
+                            pass
+                errors = [future.exception() for future in futures if future.exception() is not None]
+                late = [error.column for error in errors if isinstance(error, _NonNumericColumn)]
+                if len(late) < len(errors):
+                    raise next(error for error in errors if not isinstance(error, _NonNumericColumn))
+                if not late:
+                    results = [future.result() for future in futures]
+                    break
+                # uma coluna numérica tem texto depois das linhas usadas na inferência: a leitura é repetida
+                # com a coluna categórica (os blocos partilhados têm de ser criados de novo com o novo esquema)
+                kinds = list(kinds)
+                for column in late:
+                    kinds[column] = 'cat'
+
+        # Juntar os dicionários de categorias de todos os ficheiros e converter os códigos locais em códigos globais;
+        # as linhas em branco deixam espaços no fim de cada ficheiro, que são removidos deslocando as linhas seguintes
+        kinds_X = kinds[:-1]
+        pos = _positions(kinds_X)
+        tables = [{} for _ in range(codes.shape[1])]
+        n = 0
+        for start, (n_shard, shard_tables, _) in zip(starts, results):
+            if n != start:
+                num[n:n + n_shard] = num[start:start + n_shard]
+                codes[n:n + n_shard] = codes[start:start + n_shard]
+            for k, shard_table in enumerate(shard_tables):
+                lut = np.array([tables[k].setdefault(v, len(tables[k])) for v in shard_table] + [-1], dtype=np.int32)
+                codes[n:n + n_shard, k] = lut[codes[n:n + n_shard, k]]
+            n += n_shard
+        categories = {j: np.array(list(tables[pos[j]]), dtype=str) for j, kind in enumerate(kinds_X) if kind == 'cat'}
+        self._set_columns(kinds_X, num[:n], codes[:n], categories)
+        self.y = _narrow_label(np.concatenate([y for n_shard, _, y in results if n_shard > 0]))
+        self.features_names = header[:-1]
+        self.label = header[-1]
+
+    def save(self, dirname):
+        # Guardar o Dataset em formato binário: uma pasta com um ficheiro .npy por bloco e um cabeçalho JSON
+        # Os blocos são guardados em ordem Fortran, por isso cada coluna fica contígua no ficheiro
         try:
-            with open(filename, 'w') as f:
-                # escreve os nomes das colunas na primeira linha do ficheiro
-                f.write(','.join(self.features_names) + ',' + self.label + '\n')
-                # escreve os dados do dataset nas linhas seguintes:
-                for row in range(self.X.shape[0]):
-                    #cria string com os valores de cada coluna da linha atual, separados por vírgulas:
-                    #join() concatena uma lista de strings usando vírgula como separador 
-                    #a lista de strings é criada iterando sobre cada elemento da linha atual e convertendo-o em string
-                    f.write(','.join([str(elem) for elem in self.X[row]]) + ',' + str(self.y[row]) + '\n')
+            os.makedirs(dirname, exist_ok=True)
+            np.save(os.path.join(dirname, 'num.npy'), np.asfortranarray(self._num))
+            np.save(os.path.join(dirname, 'codes.npy'), np.asfortranarray(self._codes))
+            np.save(os.path.join(dirname, 'nulls.npy'), self._nulls)
+            y = np.asarray(self.y if self.y is not None else np.empty(0))
+            if y.dtype == object:
+                y = y.astype(str)
+            np.save(os.path.join(dirname, 'y.npy'), y)
+            header = {
+                'version': 1,
+                'n_rows': self._n,
+                'features_names': list(self.features_names) if self.features_names is not None else None,
+                'label': self.label,
+                'kinds': self._kinds,
+                'dtypes': {'num': str(self._num.dtype), 'codes': str(self._codes.dtype), 'y': str(y.dtype)},
+                'categories': {str(j): cats.tolist() for j, cats in self.categories.items()},
+            }
+            with open(os.path.join(dirname, 'header.json'), 'w') as f:
+                json.dump(header, f, indent=2)
         except IOError:
-            print(f'Erro ao escrever o ficheiro "{filename}"')
+            print(f'Erro ao escrever a pasta "{dirname}"')
 
-    def read_tsv(self, file, label=None):
-        #só muda o separador
-        self.read_csv(file, label, '\t')
+    def load(self, dirname, mmap_mode='r'):
+        # Abrir um Dataset guardado com save() usando np.memmap: nada é lido do disco até as colunas serem usadas
+        # Com mmap_mode='r' os blocos são só de leitura, 'c' permite alterações em memória (copy-on-write) e None lê tudo para memória
+        try:
+            with open(os.path.join(dirname, 'header.json'), 'r') as f:
+                header = json.load(f)
+            if header.get('version') != 1:
+                raise ValueError(f'Versão do formato não suportada: {header.get("version")}')
+            num = np.load(os.path.join(dirname, 'num.npy'), mmap_mode=mmap_mode)
+            codes = np.load(os.path.join(dirname, 'codes.npy'), mmap_mode=mmap_mode)
+            nulls = np.load(os.path.join(dirname, 'nulls.npy'), mmap_mode=mmap_mode)
+            categories = {int(j): np.array(cats, dtype=str) for j, cats in header['categories'].items()}
+            self._set_columns(header['kinds'], num, codes, categories, nulls)
+            self._n = header['n_rows']
+            self.y = np.load(os.path.join(dirname, 'y.npy'), mmap_mode=mmap_mode)
+            self.features_names = header['features_names']
+            self.label = header['label']
+        except FileNotFoundError:
+            print(f'Pasta "{dirname}" não encontrada.')
+        return self
 
-    def write_tsv(self, filename):
+    def write_csv(self, filename, sep=',', compression='infer', float_format='%r', block_size=100000, buffer_size=1 << 22):
+        # compression: 'infer' (pela extensão .gz, .xz, .bz2 ou .zst), None, 'gzip', 'xz', 'bz2' ou 'zstd'
+        # float_format: formato dos valores reais ('%r' escreve a forma mais curta que lê o mesmo valor; p.ex. '%.6g' perde precisão)
+        Dataset.write_chunks([self], filename, sep, compression, float_format, block_size, buffer_size)
+
+    @staticmethod
+    def write_chunks(chunks, filename, sep=',', compression='infer', float_format='%r', block_size=100000, buffer_size=1 << 22):
+        # Escrever uma sequência de Datasets (p.ex. um gerador de blocos) para o mesmo ficheiro, com memória constante
+        # Cada bloco de 'block_size' linhas é formatado de uma só vez e escrito numa única chamada
         try:
-            with open(filename, 'w') as f:
-                # Escreve os nomes das colunas do conjunto de dados
-                header = '\t'.join(self.features_names)
-                header += '\t'+self.label+'\n'
-                f.write(header)
-
-                # Escreve as linhas do conjunto de dados
-                for row in range(self.X.shape[0]):
-                    row_values = '\t'.join([str(elem) for elem in self.X[row]])
-                    row_values += '\t' + str(self.y[row]) + '\n'
-                    f.write(row_values)
+            with _open_output(filename, compression, buffer_size) as f:
+                header = None
+                for ds in chunks:
+                    if header is None:
+                        # escreve os nomes das colunas na primeira linha do ficheiro
+                        header = sep.join(list(ds.features_names) + [ds.label]) + '\n'
+                        f.write(header.encode('utf-8'))
+                    for start in range(0, ds._n, block_size):
+                        f.write(_format_block(ds, start, min(start + block_size, ds._n), sep, float_format))
         except IOError:
-            print("Erro ao escrever o ficheiro: " + filename)
+            print(f'Erro ao escrever o ficheiro "{filename}"')
+
+    def read_tsv(self, filename, chunksize=100000):
+        #só muda o separador
+        self.read_csv(filename, sep='\t', chunksize=chunksize)
+
+    def write_tsv(self, filename, compression='infer', float_format='%r', block_size=100000, buffer_size=1 << 22):
+        #só muda o separador
+        self.write_csv(filename, '\t', compression, float_format, block_size, buffer_size)
 
     def count_nulls(self):
-        x_nulls = np.sum(self.X == '', axis=0)
+        # Número de valores vazios de cada feature, contado diretamente nas máscaras de bits
+        x_nulls = np.unpackbits(self._nulls, axis=1).sum(axis=1)
         return x_nulls
 
-    def fill_nulls(self):
- 
-        # Função que verifica se uma coluna pode ser convertida em float
-        def is_floatable(col):
-            try:
-                col.astype(float)
-                return True
-            except ValueError:
-                return False
+    def fill_nulls(self, strategy='mean', categorical_strategy='constant', fill_value=None):
+        # Substituir os valores vazios com o Imputer: por omissão a média de cada coluna numérica e 'empty' nas categóricas
+        from imputer import Imputer
+        Imputer(strategy, categorical_strategy, fill_value).fit_transform(self)
+        print('Valores vazios substituídos.')
 
-        # Substituir valores vazios por NaN 
-        self.X[self.X == ''] = np.nan
 
-        # Ver se cada coluna pode ser convertida em float para distinguir numéricas de categóricas
-        floatable = np.apply_along_axis(is_floatable, axis=0, arr=self.X)
 
-        # Selecionar apenas as colunas numéricas
-        X_numeric = self.X[:, floatable]
-        
-        # Calcular as médias das linhas com valores numéricos, ignorando os valores NaN
-        means = np.nanmean(X_numeric.astype(float), axis=1)
-        # Substituir os valores vazios (NaN) das colunas pela média correspondente ou por 'empty' conforme seja numerico ou categorico
-        for i in range(self.X.shape[0]):
-            for j in range(self.X.shape[1]):
-                if self.X[i][j] == 'nan' and floatable[j] :
-                    self.X[i][j] = means[i]
-                elif self.X[i][j] == 'nan' and not floatable[j] :
-                    self.X[i][j] = 'empty'
-        
-        print('Valores vazios substituídos.')
+    def describe(self, k=200, random_state=0):
+        # Calcula o número de elementos, valores vazios, média, desvio padrão, mínimo, máximo e quartis de cada coluna numérica
+        # e a frequência de cada valor das colunas categóricas, numa única passagem pelos dados.
+        # Devolve um DatasetSummary (ver summary.py) que pode ser combinado com os resumos de outros blocos ou partições.
+        # random_state: semente dos sketches dos quartis (com a mesma semente o resultado é sempre o mesmo)
+        return DatasetSummary(k, random_state).update(self)
 
+if __name__ == '__main__':
+    ds = Dataset()
 
+    # Lê o ficheiro "notas.csv" e armazena os dados em X e y
+    ds.read_csv("notas.csv")
 
-    def describe(self):
-        # Calcula o número de elementos, média, desvio padrão, valor mínimo, valor máximo e quartis para cada coluna numérica:
+    # Imprime os nomes das features, a matriz X, o vetor y e o nome da label
+    print("Nomes das features:\n" + str(ds.features_names))
+    print("X:\n" + str(ds.X))
+    print("y:\n" + str(ds.y))
+    print("Label:\n" + str(ds.label))
 
-        num_elements = self.X.shape[0]
-        
-        numeric_cols = []  # Lista para guardar as colunas numéricas
-        categorical_cols = []  # Lista para guardar as colunas categóricas
-        
-        for i in range(self.X.shape[1]):  # Itera sobre as colunas 
-            try:  # Tenta converter a coluna para float
-                float_col = self.X[:, i].astype(float)
-                numeric_cols.append(i)  # Se não der erro, adiciona o índice da coluna à lista de colunas numéricas
-                
-            except ValueError:  # Se der erro ao converter para float é pq é categórica
-                categorical_cols.append(i)
-        
-        means = np.mean(self.X[:, numeric_cols].astype(float), axis=0)
-        stds = np.std(self.X[:, numeric_cols].astype(float), axis=0)
-        mins = np.min(self.X[:, numeric_cols].astype(float), axis=0)
-        maxs = np.max(self.X[:, numeric_cols].astype(float), axis=0)
-        p25 = np.percentile(self.X[:, numeric_cols].astype(float), 25, axis=0)
-        p50 = np.percentile(self.X[:, numeric_cols].astype(float), 50, axis=0)
-        p75 = np.percentile(self.X[:, numeric_cols].astype(float), 75, axis=0)
-
-        # Imprime os resultados para cada coluna numérica
-        for i in range(len(numeric_cols)):
-            feature_name = self.features_names[numeric_cols[i]]
-            print("\n")
-            print("Feature:", feature_name)
-            print("Número de elementos:", num_elements)
-            print("Valor mínimo:", mins[i])
-            print("Valor máximo: ", maxs[i])
-            print("Média:", means[i])
-            print("Desvio padrão:", stds[i])
-            print("1º Quartil:", p25[i])
-            print("2º Quartil (mediana):", p50[i])
-            print("3º Quartil:", p75[i])     
-        
-        # Calcula a frequência de cada valor para as colunas categóricas
-        for i in range(len(categorical_cols)):
-            feature_name = self.features_names[categorical_cols[i]]
-            values, counts = np.unique(self.X[:, categorical_cols[i]], return_counts=True)  # Obtém os valores únicos e as suas contagens
-            print("\n")
-            print("Feature:", feature_name)
-            print("Number of elements:", num_elements)
-            for j in range(len(values)):  # Imprime cada valor e a sua frequência
-                print(f"{values[j]}: {counts[j]} ({counts[j]/num_elements*100:.2f}%)")
-
-ds = Dataset()
-
-# Lê o ficheiro "notas.csv" e armazena os dados em X e y
-ds.read_csv("notas.csv")
-
-# Imprime os nomes das features, a matriz X, o vetor y e o nome da label
-print("Nomes das features:\n" + str(ds.features_names))
-print("X:\n" + str(ds.X))
-print("y:\n" + str(ds.y))
-print("Label:\n" + str(ds.label))
-
-# Conta e imprime o número de valores vazios em cada coluna
-print("Número de valores nulos:\n" + str(ds.count_nulls()))
-
-# Preenche os valores vazios com as médias nas colunas numéricas ou com a string 'empty' em colunas categóricas
-ds.fill_nulls()
-
-# Imprime a matriz X e o vetor y após preencher os valores vazios
-print("X:\n" + str(ds.X))
-print("y:\n" + str(ds.y))
-
-# Descreve as estatísticas de cada coluna
-ds.describe()
-
-# Testar funções de escrita para ficheiro
-ds.write_csv("teste.csv")
-ds.write_tsv("teste2.tsv")
+    # Conta e imprime o número de valores vazios em cada coluna
+    print("Número de valores nulos:\n" + str(ds.count_nulls()))
+
+    # Preenche os valores vazios com as médias nas colunas numéricas ou com a string 'empty' em colunas categóricas
+    ds.fill_nulls()
+
+    # Imprime a matriz X e o vetor y após preencher os valores vazios
+    print("X:\n" + str(ds.X))
+    print("y:\n" + str(ds.y))
+
+    # Descreve as estatísticas de cada coluna
+    print(ds.describe())
+
+    # Testar funções de escrita para ficheiro
+    ds.write_csv("teste.csv")
+    ds.write_tsv("teste2.tsv")
 
@@ -0,0 +1,190 @@
+import numpy as np
+from dataset import Dataset
+from summary import KLLSketch
+
+STRATEGIES = ('mean', 'median', 'mode', 'constant')
+
+
+def _merge_counts(values, counts, new_values, new_counts):
+    # Juntar duas tabelas de frequências (valores únicos ordenados e respetivas contagens)
+    if values is None:
+        return new_values, new_counts
+    merged, inverse = np.unique(np.concatenate([values, new_values]), return_inverse=True)
+    return merged, np.bincount(inverse, weights=np.concatenate([counts, new_counts])).astype(np.int64)
+
+def _median_from_sketch(sketch):
+    # Mediana exata enquanto o sketch guarda todos os valores (um único nível), senão a mediana aproximada do KLLSketch
+    if sketch.n == 0:
+        return np.nan
+    if len(sketch.levels) == 1:
+        return np.median(sketch.levels[0])
+    return sketch.quantile(0.5).item()
+
+
+class Imputer:
+    '''
+    Classe que substitui os valores vazios de um Dataset com uma estratégia por feature.
+    As estatísticas são calculadas uma única vez (fit ou partial_fit bloco a bloco) e depois aplicadas com transform a qualquer bloco.
+    A mediana usa um KLLSketch (memória limitada): é exata até ~sketch_k valores por feature e aproximada depois disso.
+    A moda usa uma tabela de frequências exata, que cresce com o número de valores diferentes da feature
+    (adequada a features categóricas ou discretas; numa feature contínua guarda praticamente todos os valores).
+
+    Argumentos:
+        - strategy : str ou dict -> 'mean', 'median', 'mode' ou 'constant' para as features numéricas,
+                                    ou um dicionário (índice ou nome da feature) -> estratégia
+        - categorical_strategy : str -> 'mode' ou 'constant' para as features categóricas sem estratégia no dicionário
+        - fill_value : valor ou dict -> valor usado pela estratégia 'constant' (por omissão 0 nas numéricas e 'empty' nas categóricas)
+        - sketch_k : int -> capacidade do KLLSketch da mediana (o erro no rank é aproximadamente proporcional a 1/sketch_k)
+    Parâmetros estimados:
+        - statistics_ : lista com o valor de substituição de cada feature (None se a feature não tiver valor)
+    '''
+    def __init__(self, strategy='mean', categorical_strategy='constant', fill_value=None, sketch_k=2000):
+        self.strategy = strategy
+        self.categorical_strategy = categorical_strategy
+        self.fill_value = fill_value
+        self.sketch_k = sketch_k
+        self.statistics_ = None
+        self._state = None
+
+    def _option(self, option, j, name, default):
+        # Obter o valor de uma opção para a feature j (as opções podem ser dadas por índice ou por nome)
+        if isinstance(option, dict):
+            if j in option:
+                return option[j]
+            if name in option:
+                return option[name]
+            return default
+        return default if option is None else option
+
+    def _init_state(self, ds):
+        names = ds.features_names if ds.features_names is not None else [None] * len(ds._kinds)
+        self.kinds_ = list(ds._kinds)
+        self.strategies_ = []
+        for j, kind in enumerate(self.kinds_):
+            if isinstance(self.strategy, dict):
+                strategy = self._option(self.strategy, j, names[j], 'mean' if kind == 'num' else self.categorical_strategy)
+            else:
+                strategy = self.strategy if kind == 'num' else self.categorical_strategy
+            if strategy not in STRATEGIES:
+                raise ValueError(f'Estratégia inválida: {strategy}')
+            if kind == 'cat' and strategy in ('mean', 'median'):
+                raise ValueError(f'A estratégia "{strategy}" não pode ser usada na feature categórica {names[j]}')
+            self.strategies_.append(strategy)
+        n_num = self.kinds_.count('num')
+        # Estado acumulado: somas e contagens (média), sketches (mediana) e tabelas de frequências (moda)
+        # (os sketches têm semente fixa para o resultado ser reprodutível)
+        self._state = {
+            'sums': np.zeros(n_num),
+            'counts': np.zeros(n_num, dtype=np.int64),
+            'sketches': {j: KLLSketch(self.sketch_k, seed=j) for j, strategy in enumerate(self.strategies_) if strategy == 'median'},
+            'tables': {},
+        }
+        self._names = names
+
+    def partial_fit(self, data):
+        # Acumular as estatísticas de um bloco (pode ser chamado para cada Dataset devolvido por Dataset.iter_csv)
+        ds = _as_dataset(data)
+        if self._state is None:
+            self._init_state(ds)
+        elif list(ds._kinds) != self.kinds_:
+            raise ValueError('O bloco não tem as mesmas features que os blocos anteriores.')
+        state = self._state
+        block = ds._num
+        mask = np.isnan(block)
+        # médias: somas e contagens de todas as colunas numéricas numa só passagem
+        state['sums'] += np.where(mask, 0.0, block).sum(axis=0)
+        state['counts'] += block.shape[0] - mask.sum(axis=0)
+        for j, strategy in enumerate(self.strategies_):
+            if strategy == 'median':
+                col = block[:, ds._pos[j]]
+                state['sketches'][j].update(col)
+                continue
+            if strategy != 'mode':
+                continue
+            if self.kinds_[j] == 'num':
+                col = block[:, ds._pos[j]]
+                values, counts = np.unique(col[~mask[:, ds._pos[j]]], return_counts=True)
+            else:
+                codes = ds._codes[:, ds._pos[j]]
+                counts = np.bincount(codes[codes >= 0], minlength=len(ds.categories[j]))
+                values = ds.categories[j]
+                values, counts = values[counts > 0], counts[counts > 0]
+                order = np.argsort(values)
+                values, counts = values[order], counts[order]
+            old_values, old_counts = state['tables'].get(j, (None, None))
+            state['tables'][j] = _merge_counts(old_values, old_counts, values, counts)
+        self._finalize()
+        return self
+
+    def fit(self, data):
+        self._state = None
+        return self.partial_fit(data)
+
+    def _finalize(self):
+        # Calcular o valor de substituição de cada feature a partir das estatísticas acumuladas
+        state = self._state
+        pos = 0
+        self.statistics_ = []
+        for j, (kind, strategy) in enumerate(zip(self.kinds_, self.strategies_)):
+            if strategy == 'mean':
+                count = state['counts'][pos]
+                value = state['sums'][pos] / count if count else np.nan
+            elif strategy == 'median':
+                value = _median_from_sketch(state['sketches'][j])
+            elif strategy == 'mode':
+                values, counts = state['tables'][j]
+                value = values[np.argmax(counts)].item() if len(values) else None
+            else:
+                value = self._option(self.fill_value, j, self._names[j], 0.0 if kind == 'num' else 'empty')
+            if kind == 'num':
+                pos += 1
+                value = np.nan if value is None else float(value)
+            self.statistics_.append(value)
+
+    def transform(self, data):
+        # Substituir os valores vazios pelos valores estimados
+        # Um Dataset é alterado no próprio objeto (e devolvido), uma matriz numérica é devolvida como uma cópia preenchida
+        if self.statistics_ is None:
+            raise ValueError('O Imputer tem de ser ajustado (fit ou partial_fit) antes do transform.')
+        is_array = isinstance(data, np.ndarray)
+        ds = _as_dataset(data)
+        if list(ds._kinds) != self.kinds_:
+            raise ValueError('O Dataset não tem as mesmas features que os dados usados no fit.')
+        # blocos abertos só para leitura (np.memmap) são copiados para memória
+        if not ds._num.flags.writeable:
+            ds._num = np.array(ds._num, order='F')
+        if not ds._codes.flags.writeable:
+            ds._codes = np.array(ds._codes, order='F')
+        # colunas numéricas: uma única passagem sobre o bloco com a máscara dos NaN
+        fill = np.array([value for kind, value in zip(self.kinds_, self.statistics_) if kind == 'num'], dtype=np.float64)
+        if len(fill):
+            np.copyto(ds._num, np.broadcast_to(fill, ds._num.shape), where=np.isnan(ds._num))
+        # colunas categóricas: o valor de substituição é convertido no código correspondente (nova categoria se ainda não existir)
+        for j, kind in enumerate(self.kinds_):
+            value = self.statistics_[j]
+            if kind != 'cat' or value is None:
+                continue
+            codes = ds._codes[:, ds._pos[j]]
+            missing = codes < 0
+            if not missing.any():
+                continue
+            cats = ds.categories[j]
+            found = np.flatnonzero(cats == value)
+            if len(found) == 0:
+                ds.categories[j] = np.append(cats, value)
+                code = len(cats)
+            else:
+                code = found[0]
+            codes[missing] = code
+        ds._update_nulls()
+        return ds.X if is_array else ds
+
+    def fit_transform(self, data):
+        return self.fit(data).transform(data)
+
+
+def _as_dataset(data):
+    # As matrizes numpy são convertidas para Dataset (formato por colunas)
+    if isinstance(data, np.ndarray):
+        return Dataset(X=np.array(data))
+    return data
@@ -0,0 +1,237 @@
+import numpy as np
+from collections import Counter
+
+
+class KLLSketch:
+    '''
+    Sketch KLL para quantis aproximados com memória limitada.
+    Os valores são guardados em níveis: cada elemento do nível h representa 2^h valores originais.
+    Quando um nível excede a sua capacidade é ordenado e metade dos elementos (posições pares ou ímpares, ao acaso) sobe para o nível seguinte.
+
+    Argumentos:
+        - k : int -> capacidade do nível mais alto; o erro no rank é aproximadamente proporcional a 1/k
+        - seed -> semente do gerador aleatório usado nas compactações
+    '''
+    def __init__(self, k=200, seed=None):
+        self.k = k
+        self.n = 0
+        self.levels = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    def _capacity(self, h):
+        # Os níveis mais baixos têm capacidades menores (fator 2/3 por nível), com um mínimo de 2 elementos
+        depth = len(self.levels) - h - 1
+        return max(int(np.ceil(self.k * (2 / 3) ** depth)), 2)
+
+    def _compress(self):
+        h = 0
+        while h < len(self.levels):
+            level = self.levels[h]
+            if len(level) > self._capacity(h):
+                if h + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                level = np.sort(level)
+                # compactar um número par de elementos, o elemento que sobra (se houver) fica no nível h
+                m = len(level) - len(level) % 2
+                offset = self._rng.integers(2)
+                self.levels[h + 1] = np.concatenate([self.levels[h + 1], level[offset:m:2]])
+                self.levels[h] = level[m:]
+                # ao criar um nível novo as capacidades dos níveis de baixo diminuem, por isso recomeçamos do início
+                h = 0
+                continue
+            h += 1
+
+    def update(self, values):
+        # Adicionar um bloco de valores (os NaN são ignorados)
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return self
+        self.n += len(values)
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+        return self
+
+    def merge(self, other):
+        # Juntar outro sketch (p.ex. calculado noutro processo ou noutro bloco do ficheiro)
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for h, level in enumerate(other.levels):
+            self.levels[h] = np.concatenate([self.levels[h], level])
+        self.n += other.n
+        self._compress()
+        return self
+
+    def quantile(self, q):
+        # Quantis aproximados: ordenar os elementos guardados com os respetivos pesos e procurar o rank pedido
+        q = np.asarray(q, dtype=np.float64)
+        if self.n == 0:
+            return np.full(q.shape, np.nan)
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(level), 2.0 ** h) for h, level in enumerate(self.levels)])
+        order = np.argsort(values, kind='stable')
+        values, cum = values[order], np.cumsum(weights[order])
+        idx = np.searchsorted(cum, q * cum[-1], side='left')
+        return values[np.minimum(idx, len(values) - 1)]
+
+
+class ColumnSummary:
+    '''
+    Resumo de uma feature, atualizado bloco a bloco e combinável com outros resumos da mesma feature.
+
+    Parâmetros estimados (features numéricas):
+        - count, nulls, mean, std, min, max e os quartis (quantiles) aproximados pelo KLLSketch
+    Parâmetros estimados (features categóricas):
+        - count, nulls e frequencies (Counter categoria -> número de ocorrências)
+
+    Argumentos:
+        - seed -> semente do KLLSketch (com a mesma semente os quartis são sempre os mesmos)
+    '''
+    def __init__(self, name, kind, k=200, seed=None):
+        self.name = name
+        self.kind = kind
+        self.count = 0
+        self.nulls = 0
+        self.mean = np.nan
+        self.m2 = 0.0
+        self.min = np.nan
+        self.max = np.nan
+        self.sketch = KLLSketch(k, seed) if kind == 'num' else None
+        self.frequencies = Counter() if kind == 'cat' else None
+
+    @property
+    def std(self):
+        # desvio padrão da população (como o np.std)
+        return np.sqrt(self.m2 / self.count) if self.count else np.nan
+
+    @property
+    def quantiles(self):
+        return self.sketch.quantile([0.25, 0.5, 0.75]) if self.sketch is not None else None
+
+    def _merge_moments(self, count, mean, m2, vmin, vmax):
+        # Fórmula de Chan para juntar a média e a soma dos quadrados dos desvios de dois conjuntos
+        if count == 0:
+            return
+        if self.count == 0:
+            self.mean, self.m2 = mean, m2
+        else:
+            total = self.count + count
+            delta = mean - self.mean
+            self.mean += delta * count / total
+            self.m2 += m2 + delta ** 2 * self.count * count / total
+        self.count += count
+        self.min = np.fmin(self.min, vmin)
+        self.max = np.fmax(self.max, vmax)
+
+    def merge(self, other):
+        self.nulls += other.nulls
+        if self.kind == 'num':
+            self._merge_moments(other.count, other.mean, other.m2, other.min, other.max)
+            self.sketch.merge(other.sketch)
+        else:
+            self.count += other.count
+            self.frequencies.update(other.frequencies)
+        return self
+
+    def __str__(self):
+        lines = ["Feature: " + str(self.name)]
+        if self.kind == 'num':
+            p25, p50, p75 = self.quantiles
+            lines += [
+                f"Número de elementos: {self.count}",
+                f"Valores vazios: {self.nulls}",
+                f"Valor mínimo: {self.min}",
+                f"Valor máximo: {self.max}",
+                f"Média: {self.mean}",
+                f"Desvio padrão: {self.std}",
+                f"1º Quartil: {p25}",
+                f"2º Quartil (mediana): {p50}",
+                f"3º Quartil: {p75}",
+            ]
+        else:
+            total = self.count + self.nulls
+            lines += [f"Número de elementos: {self.count}", f"Valores vazios: {self.nulls}"]
+            for value, count in self.frequencies.most_common():
+                lines.append(f"{value}: {count} ({count / total * 100:.2f}%)")
+        return '\n'.join(lines)
+
+
+class DatasetSummary:
+    '''
+    Resultado do Dataset.describe: um ColumnSummary por feature.
+    Pode ser atualizado com vários blocos (update) e combinado com resumos de outras partições (merge),
+    por isso é possível descrever ficheiros maiores do que a memória numa única passagem.
+
+    Argumentos:
+        - k : int -> parâmetro de precisão dos sketches de quantis
+        - random_state : int ou None -> semente dos sketches (cada feature usa a semente (random_state, índice da feature));
+                                        None dá quartis que podem variar entre execuções
+    '''
+    def __init__(self, k=200, random_state=0):
+        self.k = k
+        self.random_state = random_state
+        self.n_rows = 0
+        self.columns = None
+
+    def _seed(self, j):
+        return None if self.random_state is None else (self.random_state, j)
+
+    def update(self, ds):
+        # Acumular um Dataset (ou um bloco devolvido por Dataset.iter_csv)
+        names = ds.features_names if ds.features_names is not None else list(range(len(ds._kinds)))
+        if self.columns is None:
+            self.columns = [ColumnSummary(name, kind, self.k, self._seed(j)) for j, (name, kind) in enumerate(zip(names, ds._kinds))]
+        elif [c.kind for c in self.columns] != list(ds._kinds):
+            raise ValueError('O bloco não tem as mesmas features que os blocos anteriores.')
+        self.n_rows += ds._n
+        nulls = np.unpackbits(ds._nulls, axis=1).sum(axis=1)
+
+        # Features numéricas: momentos do bloco calculados para todas as colunas de uma vez e depois juntos com a fórmula de Chan
+        block = ds._num
+        has_rows = block.shape[0] > 0 and block.shape[1] > 0
+        if has_rows:
+            mask = np.isnan(block)
+            counts = block.shape[0] - mask.sum(axis=0)
+            sums = np.where(mask, 0.0, block).sum(axis=0)
+            means = np.divide(sums, counts, out=np.full(len(counts), np.nan), where=counts > 0)
+            dev = np.where(mask, 0.0, block - means)
+            m2 = (dev * dev).sum(axis=0)
+            mins = np.fmin.reduce(block, axis=0)
+            maxs = np.fmax.reduce(block, axis=0)
+
+        for j, column in enumerate(self.columns):
+            column.nulls += int(nulls[j])
+            p = ds._pos[j]
+            if column.kind == 'num':
+                if not has_rows:
+                    continue
+                column._merge_moments(int(counts[p]), means[p], m2[p], mins[p], maxs[p])
+                column.sketch.update(block[:, p])
+            else:
+                # frequências a partir dos códigos (bincount) guardadas num Counter indexado pela categoria
+                codes = ds._codes[:, p]
+                freq = np.bincount(codes[codes >= 0], minlength=len(ds.categories[j]))
+                present = np.flatnonzero(freq)
+                column.count += int(freq.sum())
+                column.frequencies.update(dict(zip(ds.categories[j][present].tolist(), freq[present].tolist())))
+        return self
+
+    def merge(self, other):
+        # Juntar o resumo de outra partição dos dados (com as mesmas features)
+        if other.columns is None:
+            return self
+        if self.columns is None:
+            self.columns = [ColumnSummary(c.name, c.kind, self.k, self._seed(j)) for j, c in enumerate(other.columns)]
+        for column, other_column in zip(self.columns, other.columns):
+            column.merge(other_column)
+        self.n_rows += other.n_rows
+        return self
+
+    def __getitem__(self, name):
+        for column in self.columns:
+            if column.name == name:
+                return column
+        raise KeyError(name)
+
+    def __str__(self):
+        return '\n\n'.join(str(column) for column in self.columns or [])
@@ -0,0 +1,65 @@
+import pytest
+
+from dataset import Dataset
+
+
+def _write(path, rows):
+    with open(path, 'w') as f:
+        f.write('\n'.join(rows) + '\n')
+    return str(path)
+
+
+def test_read_csv_late_text_column_does_not_depend_on_chunksize(tmp_path):
+    # a coluna 'a' só tem texto na última linha: os valores anteriores têm de manter o texto original
+    rows = ['a,b,y', '01234,1,x', '1e3,2,y', '1.0,3,x', '2,4,y', '1.0,5,x', 'abc,6,y']
+    filename = _write(tmp_path / 'late.csv', rows)
+    results = []
+    for chunksize in (1, 2, 3, 100):
+        ds = Dataset()
+        ds.read_csv(filename, chunksize=chunksize)
+        results.append(ds)
+    for ds in results:
+        assert ds._kinds == ['cat', 'num']
+        assert ds.categories[0].tolist() == ['01234', '1e3', '1.0', '2', 'abc']
+        assert ds.X[:, 0].tolist() == ['01234', '1e3', '1.0', '2', '1.0', 'abc']
+        assert ds.X[:, 1].tolist() == [1, 2, 3, 4, 5, 6]
+        assert ds.y.tolist() == ['x', 'y', 'x', 'y', 'x', 'y']
+
+
+def test_read_csv_late_text_label(tmp_path):
+    filename = _write(tmp_path / 'label.csv', ['a,y', '1,1.0', '2,2', '3,z'])
+    ds = Dataset()
+    ds.read_csv(filename, chunksize=1)
+    assert ds.y.tolist() == ['1.0', '2', 'z']
+
+
+def test_read_csv_shards_promotes_mixed_kinds(tmp_path):
+    # a coluna 'a' é numérica no primeiro ficheiro e tem texto no segundo: passa a categórica em vez de levantar um erro
+    first = _write(tmp_path / 'part1.csv', ['a,b,y', '1.0,1,x', '2,2,y'])
+    second = _write(tmp_path / 'part2.csv', ['a,b,y', 'abc,3,x'])
+    ds = Dataset()
+    ds.read_csv_shards([first, second], n_workers=2)
+    whole = Dataset()
+    whole.read_csv(_write(tmp_path / 'whole.csv', ['a,b,y', '1.0,1,x', '2,2,y', 'abc,3,x']))
+    assert ds._kinds == whole._kinds == ['cat', 'num']
+    assert ds.categories[0].tolist() == whole.categories[0].tolist() == ['1.0', '2', 'abc']
+    assert ds.X[:, 1].tolist() == [1, 2, 3]
+
+
+def test_read_csv_shards_rejects_different_headers(tmp_path):
+    first = _write(tmp_path / 'part1.csv', ['a,b,y', '1,1,x'])
+    second = _write(tmp_path / 'part2.csv', ['a,c,y', '2,2,y'])
+    with pytest.raises(ValueError):
+        Dataset().read_csv_shards([first, second], n_workers=2)
+
+
+def test_read_csv_shards_late_text_with_other_workers_running(tmp_path):
+    # o ficheiro pequeno acaba (com o erro do texto tardio) enquanto o maior ainda está a ser escrito nos blocos partilhados
+    small = _write(tmp_path / 'small.csv', ['a,b,y'] + [f'{i},{i},1' for i in range(2000)] + ['zzz,0,1'])
+    large = _write(tmp_path / 'large.csv', ['a,b,y'] + [f'{i},{i},0' for i in range(100000)])
+    ds = Dataset()
+    ds.read_csv_shards([small, large], n_workers=2, chunksize=1000)
+    assert ds._kinds == ['cat', 'num']
+    assert ds._n == 102001
+    assert ds.X[2000].tolist() == ['zzz', 0.0]
+    assert ds.X[-1].tolist() == ['99999', 99999.0]
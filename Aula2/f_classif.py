@@ -1,20 +1,108 @@
 import numpy as np
-from scipy.stats import f_oneway
-
-def f_classif(X, y):
-    # Garantir que X e y são arrays numpy
-    #X = np.asarray(X)
-    #y = np.asarray(y)
-    # Obter o número de features e o número de classes
-    n_features = X.shape[1]
-    n_classes = len(np.unique(y))
-    # Inicializar os arrays para armazenar os valores de F e p
-    F = np.zeros(n_features)
-    p = np.zeros(n_features)
-    # Para cada feature:
-    for i in range(n_features):
-        # Agrupar as amostras pela classe
-        groups = [X[y == c, i] for c in range(n_classes)]
-        # Aplicar a função f_oneway aos grupos
-        F[i], p[i] = f_oneway(*groups)
-    return F, p
+import scipy.sparse as sp
+from scipy.stats import f as f_dist
+
+def chunk_rows(n_features, chunksize=None):
+    # Número de linhas por bloco: por omissão blocos de ~8M valores (64 MB em float64)
+    return chunksize or max(1, (1 << 23) // max(n_features, 1))
+
+def _class_stats(X, codes, n_classes, chunksize=None):
+    # Número de amostras, média e soma dos quadrados dos desvios (M2) de cada feature por classe, calculados bloco a bloco.
+    # Em cada bloco as médias por classe vêm de um produto de matrizes (a matriz one-hot das classes, n_classes x linhas do bloco,
+    # multiplicada pelo bloco de X) e o M2 é calculado a partir dos desvios a essas médias (duas passagens pelo bloco, sem o
+    # cancelamento de soma(x^2) - soma(x)^2 / n); os blocos são juntos com a fórmula de Chan.
+    # A one-hot é esparsa (um valor por linha do bloco), por isso a memória não cresce com o número de classes
+    n_samples, n_features = X.shape
+    chunksize = chunk_rows(n_features, chunksize)
+    counts = np.zeros(n_classes, dtype=np.int64)
+    means = np.zeros((n_classes, n_features))
+    m2 = np.zeros((n_classes, n_features))
+    for start in range(0, n_samples, chunksize):
+        end = min(start + chunksize, n_samples)
+        block = np.asarray(X[start:end], dtype=np.float64)
+        block_codes = codes[start:end]
+        onehot = sp.csc_matrix((np.ones(end - start), block_codes, np.arange(end - start + 1)), shape=(n_classes, end - start))
+        block_counts = np.bincount(block_codes, minlength=n_classes)
+        block_means = (onehot @ block) / np.maximum(block_counts, 1)[:, None]
+        dev = block - block_means[block_codes]
+        block_m2 = onehot @ (dev * dev)
+        total = counts + block_counts
+        delta = block_means - means
+        weight = np.divide(block_counts, total, out=np.zeros(n_classes), where=total > 0)[:, None]
+        means += delta * weight
+        m2 += block_m2 + delta ** 2 * (counts * weight[:, 0])[:, None]
+        counts = total
+    return counts, means, m2
+
+class AnovaStats:
+    '''
+    Estatísticas suficientes da ANOVA, acumuladas bloco a bloco: para cada classe o número de amostras,
+    a média e a soma dos quadrados dos desvios (M2) de cada feature.
+    Os estados de blocos ou processos diferentes podem ser juntos com merge (fórmula de Chan), as classes não precisam de ser as mesmas.
+
+    Argumentos:
+        - chunksize : int -> número de linhas processadas de cada vez em update
+    '''
+    def __init__(self, chunksize=None):
+        self.chunksize = chunksize
+        self.classes = None
+        self.counts = None
+        self.means = None
+        self.m2 = None
+
+    def update(self, X, y):
+        # Acumular um bloco (X, y)
+        y = np.asarray(y)
+        classes, codes = np.unique(y, return_inverse=True)
+        counts, means, m2 = _class_stats(X, codes, len(classes), self.chunksize)
+        keep = counts > 0
+        return self._merge(classes[keep], counts[keep], means[keep], m2[keep])
+
+    def merge(self, other):
+        # Juntar o estado de outro bloco ou processo
+        if other.classes is None:
+            return self
+        return self._merge(other.classes, other.counts, other.means, other.m2)
+
+    def _merge(self, classes, counts, means, m2):
+        if self.classes is None:
+            self.classes, self.counts, self.means, self.m2 = classes, counts, means, m2
+            return self
+        # alinhar as classes dos dois estados (uma classe que falte num deles tem contagem 0)
+        all_classes = np.union1d(self.classes, classes)
+        n_features = self.means.shape[1]
+        state = []
+        for c, n, mean, sq in ((self.classes, self.counts, self.means, self.m2), (classes, counts, means, m2)):
+            idx = np.searchsorted(all_classes, c)
+            full = [np.zeros(len(all_classes), dtype=np.int64), np.zeros((len(all_classes), n_features)), np.zeros((len(all_classes), n_features))]
+            full[0][idx], full[1][idx], full[2][idx] = n, mean, sq
+            state.append(full)
+        (na, ma, m2a), (nb, mb, m2b) = state
+        total = (na + nb)[:, None]
+        delta = mb - ma
+        self.classes = all_classes
+        self.counts = na + nb
+        self.means = ma + delta * nb[:, None] / total
+        self.m2 = m2a + m2b + delta ** 2 * (na * nb)[:, None] / total
+        return self
+
+    def scores(self):
+        # Valores de F e p da ANOVA para todas as features de uma vez
+        counts = self.counts[:, None]
+        n = counts.sum()
+        k = len(counts)
+        grand_mean = (counts * self.means).sum(axis=0) / n
+        # variação entre as classes e dentro das classes
+        ss_between = (counts * (self.means - grand_mean) ** 2).sum(axis=0)
+        ss_within = self.m2.sum(axis=0)
+        df_between, df_within = k - 1, n - k
+        with np.errstate(divide='ignore', invalid='ignore'):
+            F = (ss_between / df_between) / (ss_within / df_within)
+        p = f_dist.sf(F, df_between, df_within)
+        return F, p
+
+def f_classif(X, y, chunksize=None):
+    # Teste F da ANOVA para cada feature: as classes são codificadas uma única vez (podem ter qualquer valor)
+    # e as estatísticas de todas as features são calculadas em conjunto, em blocos de 'chunksize' linhas (por omissão ~64 MB)
+    # (X pode ser um np.memmap maior do que a memória)
+    return AnovaStats(chunksize).update(X, y).scores()
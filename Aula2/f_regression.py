@@ -1,18 +1,85 @@
 import numpy as np
-from scipy.stats import linregress
+from scipy.stats import f as f_dist
 
 # Definir a função f_regression
-def f_regression(X, y):
-    # Garantir que X e y são arrays numpy
-    #X = np.asarray(X)
-    #y = np.asarray(y)
-    # Obter o número de features
-    n_features = X.shape[1]
-    # Inicializar o array para armazenar os valores de p
-    p = np.zeros(n_features)
-    # Para cada feature:
-    for i in range(n_features):
-        # Aplicar a função linregress
-        slope, intercept, r_value, p_value, std_err = linregress(X[:, i], y)
-        p[i] = p_value
-    return p
+def f_regression(X, y, dtype=np.float64, block_size=None):
+    # Teste F da regressão linear univariada de y em cada feature, em forma fechada:
+    # y é centrado uma única vez e a correlação de todas as features com y sai de um produto matriz-vetor por bloco de colunas
+    # dtype: np.float32 reduz para metade a memória e o tempo dos blocos (as somas finais são feitas em float64)
+    # block_size: número de colunas por bloco (por omissão blocos de ~8M valores), para matrizes muito largas
+    n_samples, n_features = X.shape
+    y = np.asarray(y, dtype=np.float64)
+    y_centered = y - y.mean()
+    y_norm = np.sqrt(y_centered @ y_centered)
+    y_centered = y_centered.astype(dtype)
+    block_size = block_size or max(1, (1 << 23) // max(n_samples, 1))
+    corr = np.empty(n_features)
+    for start in range(0, n_features, block_size):
+        end = min(start + block_size, n_features)
+        block = np.asarray(X[:, start:end], dtype=dtype)
+        block = block - block.mean(axis=0, dtype=np.float64).astype(dtype)
+        x_norm = np.sqrt(np.einsum('ij,ij->j', block, block, dtype=np.float64))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            corr[start:end] = (y_centered @ block).astype(np.float64) / (x_norm * y_norm)
+    # F = r^2 / (1 - r^2) * (n - 2), com 1 e n - 2 graus de liberdade (o p é igual ao do linregress)
+    df = n_samples - 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        F = corr ** 2 / (1 - corr ** 2) * df
+    p = f_dist.sf(F, 1, df)
+    return F, p
+
+
+class RegressionStats:
+    '''
+    Estatísticas suficientes do f_regression, acumuladas bloco a bloco: número de amostras, médias de X e de y,
+    somas dos quadrados dos desvios (M2) de cada feature e de y e os produtos cruzados dos desvios de cada feature com y.
+    Os estados de blocos ou processos diferentes podem ser juntos com merge (fórmula de Chan).
+    '''
+    def __init__(self):
+        self.n = 0
+        self.mean_x = None
+        self.mean_y = 0.0
+        self.m2_x = None
+        self.m2_y = 0.0
+        self.cross = None
+
+    def update(self, X, y):
+        # Acumular um bloco (X, y): momentos do bloco calculados com os dados centrados no próprio bloco
+        block = np.asarray(X, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        if len(y) == 0:
+            return self
+        mean_x, mean_y = block.mean(axis=0), y.mean()
+        block = block - mean_x
+        y_centered = y - mean_y
+        return self._merge(len(y), mean_x, mean_y, np.einsum('ij,ij->j', block, block), y_centered @ y_centered, y_centered @ block)
+
+    def merge(self, other):
+        # Juntar o estado de outro bloco ou processo
+        if other.n == 0:
+            return self
+        return self._merge(other.n, other.mean_x, other.mean_y, other.m2_x, other.m2_y, other.cross)
+
+    def _merge(self, n, mean_x, mean_y, m2_x, m2_y, cross):
+        if self.n == 0:
+            self.n, self.mean_x, self.mean_y, self.m2_x, self.m2_y, self.cross = n, mean_x, mean_y, m2_x, m2_y, cross
+            return self
+        total = self.n + n
+        dx, dy = mean_x - self.mean_x, mean_y - self.mean_y
+        w = self.n * n / total
+        self.m2_x = self.m2_x + m2_x + dx ** 2 * w
+        self.m2_y = self.m2_y + m2_y + dy ** 2 * w
+        self.cross = self.cross + cross + dx * dy * w
+        self.mean_x = self.mean_x + dx * n / total
+        self.mean_y = self.mean_y + dy * n / total
+        self.n = total
+        return self
+
+    def scores(self):
+        # Valores de F e p a partir da correlação de cada feature com y
+        df = self.n - 2
+        with np.errstate(divide='ignore', invalid='ignore'):
+            corr = self.cross / np.sqrt(self.m2_x * self.m2_y)
+            F = corr ** 2 / (1 - corr ** 2) * df
+        p = f_dist.sf(F, 1, df)
+        return F, p
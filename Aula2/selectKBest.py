@@ -1,10 +1,37 @@
 import numpy as np
 #from sklearn.feature_selection import f_classif, f_regression
+import os
 import sys
+from concurrent.futures import ProcessPoolExecutor
 sys.path.append('../Aula1')
 from dataset import Dataset
-from f_classif import f_classif
-from f_regression import f_regression
+from f_classif import f_classif, AnovaStats
+from f_regression import f_regression, RegressionStats
+from shared_array import _shared_X, _open_shared_X
+
+# Estatísticas suficientes de cada score function, usadas no partial_fit
+SUFFICIENT_STATS = {f_classif: AnovaStats, f_regression: RegressionStats}
+
+def _score_block(score_func, X_ref, y, start, end):
+    # Executado num worker: abrir X (sem cópia) e calcular F e p das colunas [start, end)
+    X = _open_shared_X(X_ref)
+    return score_func(X[:, start:end], y)
+
+def _top_k(p, k):
+    # Índices dos k menores valores de p em O(n) com np.argpartition; os empates são resolvidos pelo menor índice
+    # e os NaN ficam sempre no fim. O resultado vem ordenado por p (e pelo índice nos empates)
+    p = np.where(np.isnan(p), np.inf, p)
+    k = min(k, len(p))
+    if k == 0:
+        return np.empty(0, dtype=np.intp)
+    if k < len(p):
+        kth = p[np.argpartition(p, k - 1)[k - 1]]
+        better = np.flatnonzero(p < kth)
+        ties = np.flatnonzero(p == kth)[:k - len(better)]
+        idx = np.concatenate([better, ties])
+    else:
+        idx = np.arange(len(p))
+    return idx[np.lexsort((idx, p[idx]))]
 
 # Definir a classe SelectKBest
 class SelectKBest():
@@ -14,69 +41,126 @@ class SelectKBest():
     Argumentos:
         - score_func -> Score function usada para filtrar as features
         - K : int -> Número de features a selecionar
+        - n_jobs : int -> Número de processos usados no fit (blocos de colunas pontuados em paralelo; -1 usa todos os cores)
     Parâmetros estimados:
         - F_ :  Array de tamanho n (para n features) -> Mede a variação entre as classes em relação à variação dentro das classes. 
                                                         Quanto maior o valor F, maior é a diferença entre as classes e mais relevante é a característica. 
         - p_ :  Array de tamanho n (para n features) -> Indicador do nível de significância estatística do valor F.
                                                         Representa a probabilidade de que a diferença observada entre as classes seja devida ao acaso e não à influência da característica.
                                                         Ou seja, quanto menor o valor p, menor é a probabilidade de que a característica seja irrelevante.
+        - indices_ : Array de tamanho K -> Índices das features selecionadas, ordenados pelo p_value
+        - stats_ : AnovaStats ou RegressionStats -> Estatísticas suficientes acumuladas pelo partial_fit (podem ser juntas com merge)
     '''
-    def __init__(self, score_func=f_regression, k=2):
+    def __init__(self, score_func=f_regression, k=2, n_jobs=1):
         self.score_func = score_func # função para a pontuação
         self.k = k # número de características a selecionar
+        self.n_jobs = n_jobs # número de processos para pontuar as features
+        self.indices_ = None # índices das características selecionadas
+        self.stats_ = None # estatísticas acumuladas pelo partial_fit
     
     # Estimar os parâmetros F e p para cada característica usando a score_func
     def fit(self, X, y):
         # Garantir que X e y são arrays numpy
         #X = np.asarray(X)
         #y = np.asarray(y)
-        # Calcular F e p para cada característica usando a score_func
-        if self.score_func == f_classif:
+        # Calcular F e p para cada característica usando a score_func (f_classif e f_regression devolvem os dois)
+        n_jobs = os.cpu_count() if self.n_jobs == -1 else self.n_jobs
+        if n_jobs > 1 and X.shape[1] > 1:
+            F, p = self._parallel_scores(X, y, n_jobs)
+        else:
             F, p = self.score_func(X, y)
-            self.F_ = F
-            self.p_ = p
-        elif self.score_func == f_regression:
-            p = self.score_func(X, y)
-            self.p_ = p    
+        self.F_ = F
+        self.p_ = p
+        self.stats_ = None
+        self.indices_ = _top_k(self.p_, self.k)
+
+        return self
+
+    # Dividir as colunas em blocos e pontuá-los num conjunto de processos que leem X de memória partilhada
+    def _parallel_scores(self, X, y, n_jobs):
+        y = np.asarray(y)
+        bounds = np.linspace(0, X.shape[1], min(4 * n_jobs, X.shape[1]) + 1).astype(int)
+        # em ordem Fortran para que cada bloco de colunas seja contíguo
+        X_ref, tmp = _shared_X(X, 'F', 'selectkbest_')
+        try:
+            with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+                futures = [pool.submit(_score_block, self.score_func, X_ref, y, start, end)
+                           for start, end in zip(bounds[:-1], bounds[1:])]
+                results = [future.result() for future in futures]
+        finally:
+            if tmp is not None:
+                os.unlink(tmp)
+        return np.concatenate([F for F, _ in results]), np.concatenate([p for _, p in results])
 
+    # Acumular as estatísticas suficientes de um bloco (X_chunk, y_chunk) sem guardar os dados
+    def partial_fit(self, X_chunk, y_chunk):
+        if self.score_func not in SUFFICIENT_STATS:
+            raise ValueError('O partial_fit só está disponível para f_classif e f_regression.')
+        if self.stats_ is None:
+            self.stats_ = SUFFICIENT_STATS[self.score_func]()
+        self.stats_.update(X_chunk, y_chunk)
+        self.F_, self.p_, self.indices_ = None, None, None
+        return self
+
+    # Juntar o estado de outro SelectKBest (p.ex. calculado noutro processo com outra parte dos dados)
+    def merge(self, other):
+        if other.stats_ is not None:
+            if self.stats_ is None:
+                self.stats_ = SUFFICIENT_STATS[self.score_func]()
+            self.stats_.merge(other.stats_)
+            self.F_, self.p_, self.indices_ = None, None, None
+        return self
+
+    # Calcular F e p a partir das estatísticas acumuladas (chamado pelo transform se ainda não tiver sido feito)
+    def finalize(self):
+        if self.stats_ is None:
+            raise ValueError('O SelectKBest tem de ser ajustado (fit ou partial_fit) antes do finalize ou do transform.')
+        self.F_, self.p_ = self.stats_.scores()
+        self.indices_ = _top_k(self.p_, self.k)
         return self
     
     # Selecionar as k características com o p_value mais baixo
     def transform(self, X):
         # Garantir que X é um array numpy
         #X = np.asarray(X)
-        # Obter os índices das k características com o p_value mais baixo:
-        k = min(self.k, X.shape[1]) # garantir que k não é maior que o número de características
-        idx = np.argsort(self.p_)[:k] # ordenar os índices pelo p_value e selecionar os primeiros k
-        # Retornar a matriz X com apenas as k características selecionadas
-        return X[:, idx]
+        if getattr(self, 'p_', None) is None:
+            self.finalize()
+        # Os índices das k características com o p_value mais baixo são calculados no fit (self.indices_),
+        # por isso o transform é só uma recolha das colunas (também funciona com blocos de um np.memmap)
+        return X[:, self.indices_]
     
     def fit_transform(self, X, y):
         return self.fit(X, y).transform(X)
     
 
-# Criar um conjunto de dados de teste
-dataset = Dataset(X=np.array([[1, 3, 5, 7],
- [9, 5, 6, 8],
- [3, 200, 2, 1],
- [12, 6, 8, 6]]),
- y=np.array([0, 1, 0, 1]),
- features_names=["f1", "f2", "f3", "f4"],
- label="y")
+if __name__ == '__main__':
+    # Criar um conjunto de dados de teste
+    dataset = Dataset(X=np.array([[1, 3, 5, 7],
+     [9, 5, 6, 8],
+     [3, 200, 2, 1],
+     [12, 6, 8, 6]]),
+     y=np.array([0, 1, 0, 1]),
+     features_names=["f1", "f2", "f3", "f4"],
+     label="y")
 
-X = dataset.X
-y = dataset.y
+    X = dataset.X
+    y = dataset.y
 
-# Criar uma instância do transformador SelectKBest
-skb = SelectKBest()
+    # Criar uma instância do transformador SelectKBest
+    skb = SelectKBest()
 
-#X_new = skb.fit_transform(X, y)
-skb = skb.fit(X,y)
-X_new = skb.transform(X)
-print(X)
-print("Forma da matriz original:", X.shape)
-if skb.score_func == 'f_classif':
+    #X_new = skb.fit_transform(X, y)
+    skb = skb.fit(X,y)
+    X_new = skb.transform(X)
+    print(X)
+    print("Forma da matriz original:", X.shape)
     print("Valores de F para cada característica:", skb.F_)
-print("Valores de p para cada característica:", skb.p_)
-print(X_new)
-print("Forma da matriz transformada:", X_new.shape)
+    print("Valores de p para cada característica:", skb.p_)
+    print(X_new)
+    print("Forma da matriz transformada:", X_new.shape)
+
+    # O mesmo resultado com os dados divididos em dois blocos, processados por dois SelectKBest diferentes e depois juntos
+    skb_a = SelectKBest().partial_fit(X[:2], y[:2])
+    skb_b = SelectKBest().partial_fit(X[2:], y[2:])
+    skb_a.merge(skb_b)
+    print("Valores de p (partial_fit + merge):", skb_a.finalize().p_)
@@ -0,0 +1,47 @@
+import mmap
+import os
+import tempfile
+import numpy as np
+
+def _memmap_offset(X):
+    # Posição (em bytes) do início dos dados de X no ficheiro, ou None se não for possível saber.
+    # As fatias de um np.memmap guardam o 'offset' do memmap original, por isso a posição é calculada a partir do endereço
+    # dos dados em relação ao início do mapeamento (que começa no múltiplo de ALLOCATIONGRANULARITY anterior ao offset original)
+    mm = getattr(X, '_mmap', None)
+    if mm is None:
+        return None
+    try:
+        base = np.frombuffer(mm, dtype=np.uint8).ctypes.data
+    except (TypeError, ValueError):
+        return None
+    delta = X.ctypes.data - base
+    if not 0 <= delta <= len(mm) - X.nbytes:
+        return None
+    return X.offset - X.offset % mmap.ALLOCATIONGRANULARITY + delta
+
+def _shared_X(X, order='F', prefix='shared_'):
+    # Referência para X que os workers podem abrir sem receberem uma cópia (pickle) da matriz:
+    # um np.memmap contíguo é aberto diretamente (na posição real dos dados no ficheiro); outra matriz (ou um memmap em modo 'c',
+    # que pode ter alterações só em memória) é copiada uma vez para um ficheiro mapeado em memória (em /dev/shm se existir),
+    # na ordem 'order' ('F' se os workers leem colunas, 'C' se leem linhas).
+    # Devolve (referência, ficheiro temporário a apagar no fim ou None)
+    if order not in ('C', 'F'):
+        raise ValueError("order must be 'C' or 'F'")
+    if (isinstance(X, np.memmap) and X.filename is not None and X.mode != 'c'
+            and (X.flags.c_contiguous or X.flags.f_contiguous)):
+        offset = _memmap_offset(X)
+        if offset is not None:
+            return {'filename': X.filename, 'dtype': X.dtype.str, 'shape': X.shape, 'offset': offset,
+                    'order': 'C' if X.flags.c_contiguous else 'F'}, None
+    X = np.asarray(X)
+    fd, filename = tempfile.mkstemp(prefix=prefix, dir='/dev/shm' if os.path.isdir('/dev/shm') else None)
+    os.close(fd)
+    shared = np.memmap(filename, dtype=X.dtype, mode='w+', shape=X.shape, order=order)
+    shared[:] = X
+    shared.flush()
+    return {'filename': filename, 'dtype': X.dtype.str, 'shape': X.shape, 'offset': 0, 'order': order}, filename
+
+def _open_shared_X(X_ref):
+    # Executado num worker: abrir (só para leitura e sem cópia) a matriz de uma referência criada por _shared_X
+    return np.memmap(X_ref['filename'], dtype=X_ref['dtype'], mode='r', shape=tuple(X_ref['shape']),
+                     offset=X_ref['offset'], order=X_ref['order'])
@@ -0,0 +1,23 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Aula1'))
+from f_classif import f_classif
+from selectKBest import SelectKBest
+
+
+def test_parallel_fit_on_sliced_memmap(tmp_path):
+    # uma fatia de colunas de um np.memmap guarda o offset do memmap original: os workers têm de ler as mesmas colunas que o fit em série
+    rng = np.random.default_rng(0)
+    y = rng.integers(0, 2, 1000)
+    X = rng.normal(size=(1000, 6))
+    X[:, 3] += 3 * y
+    filename = str(tmp_path / 'X.npy')
+    np.save(filename, np.asfortranarray(X))
+    X_slice = np.load(filename, mmap_mode='r')[:, 2:5]
+    serial = SelectKBest(f_classif, k=1).fit(X_slice, y)
+    parallel = SelectKBest(f_classif, k=1, n_jobs=2).fit(X_slice, y)
+    np.testing.assert_allclose(parallel.p_, serial.p_)
+    assert serial.indices_.tolist() == parallel.indices_.tolist() == [1]
@@ -1,31 +1,98 @@
 import numpy as np
+import scipy.sparse as sp
 import sys
 sys.path.append('../Aula1')
 from dataset import Dataset
 
+def _chunk_moments(X):
+  # Número de linhas, média e soma dos quadrados dos desvios (M2) de cada feature de um bloco
+  n = X.shape[0]
+  if sp.issparse(X):
+    # matrizes esparsas (CSR ou CSC): só os valores diferentes de zero são percorridos, os zeros implícitos
+    # contribuem com (0 - média)^2 cada um
+    if X.format not in ('csr', 'csc'):
+      X = X.tocsr()
+    if X.format == 'csr':
+      cols = X.indices
+    else:
+      cols = np.repeat(np.arange(X.shape[1]), np.diff(X.indptr))
+    nnz = np.bincount(cols, minlength=X.shape[1])
+    mean = np.bincount(cols, weights=X.data, minlength=X.shape[1]) / n
+    dev = X.data - mean[cols]
+    m2 = np.bincount(cols, weights=dev * dev, minlength=X.shape[1]) + (n - nnz) * mean ** 2
+    return n, mean, m2
+  X = np.asarray(X, dtype=np.float64)
+  mean = X.mean(axis=0)
+  dev = X - mean
+  return n, mean, np.einsum('ij,ij->j', dev, dev)
+
+def _column_selection(idx):
+  # Converter os índices das colunas num slice (para devolver uma vista) quando estão igualmente espaçados
+  if len(idx) == 0:
+    return slice(0, 0)
+  if len(idx) == 1:
+    return slice(idx[0], idx[0] + 1)
+  step = idx[1] - idx[0]
+  if np.all(np.diff(idx) == step):
+    return slice(idx[0], idx[-1] + 1, step)
+  return idx
+
 class VarianceThreshold:
   '''
   Classe que faz seleção/filtração de features de um Dataset utilizando um limite de variância
   Todas as features cuja variância seja menor ou igual a este limite são eliminadas do Dataset
+  Aceita matrizes densas ou esparsas (scipy.sparse CSR/CSC) e dados em blocos (partial_fit), os estados de vários blocos
+  ou processos podem ser juntos com merge
 
   Argumentos:
       - limite : float -> O valor limite usado para filtrar as features
   Parâmetros estimados:
       - variancia : array de tamanho n (para n features) -> Guarda variância de cada feature do Dataset
+      - n_, media_, m2_ : número de linhas, média e soma dos quadrados dos desvios de cada feature (estado do partial_fit)
   '''
   # Inicializar o transformador com o argumento limite
   def __init__(self, limite):
     self.limite = limite
     self.variancia = None
+    self.n_ = 0
+    self.media_ = None
+    self.m2_ = None
 
   # Calcular a variância de cada feature na matriz de entrada
   def fit(self, X):
-    self.variancia = np.var(X, axis=0)
+    self.n_ = 0
+    return self.partial_fit(X)
+
+  # Acumular um bloco de linhas, juntando as médias e M2 com a fórmula de Chan (numericamente estável)
+  def partial_fit(self, X):
+    return self._merge(*_chunk_moments(X))
+
+  # Juntar o estado de outro VarianceThreshold (p.ex. calculado noutro processo)
+  def merge(self, other):
+    if other.n_ == 0:
+      return self
+    return self._merge(other.n_, other.media_, other.m2_)
+
+  def _merge(self, n, media, m2):
+    if n == 0:
+      return self
+    if self.n_ == 0:
+      self.n_, self.media_, self.m2_ = n, media, m2
+    else:
+      total = self.n_ + n
+      delta = media - self.media_
+      self.m2_ = self.m2_ + m2 + delta ** 2 * self.n_ * n / total
+      self.media_ = self.media_ + delta * n / total
+      self.n_ = total
+    self.variancia = self.m2_ / self.n_
     return self
 
   # Selecionar as features com variância superior ao limite
+  # Se as colunas selecionadas estiverem igualmente espaçadas é devolvida uma vista de X (sem cópia);
+  # nas matrizes esparsas é devolvida a matriz esparsa só com essas colunas
   def transform(self, X):
-    return  X[:, self.variancia > self.limite]
+    idx = np.flatnonzero(self.variancia > self.limite)
+    return X[:, _column_selection(idx)]
 
   def fit_transform(self, X):
     return self.fit(X).transform(X)
@@ -57,3 +124,12 @@ print("features names:")
 print(dataset.features_names)
 print("X:")
 print(dataset.X)
+
+print("----------- matriz esparsa, em dois blocos --------------")
+X_sparse = sp.csr_matrix(np.array([[0, 2, 0, 3],
+                                   [0, 1, 4, 3],
+                                   [0, 1, 1, 3]]))
+selector = VarianceThreshold(0.0).partial_fit(X_sparse[:2])
+selector.partial_fit(X_sparse[2:])
+print("Variância: " + str(selector.variancia))
+print(selector.transform(X_sparse).toarray())
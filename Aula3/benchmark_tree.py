@@ -0,0 +1,196 @@
+'''
+Benchmark da DecisionTree: tempo do fit, débito do predict, pico de memória e número de nós
+em dados sintéticos com diferentes números de linhas, features, classes, cardinalidades e critérios.
+
+Exemplos (a partir da pasta Aula3, sem acesso à rede):
+    python benchmark_tree.py --preset quick --output resultados.json
+    python benchmark_tree.py --preset full --output novo.json --baseline resultados.json --tolerance 0.2
+    python benchmark_tree.py --rows 100000 --features 20 --criterion gini --sklearn
+'''
+import argparse
+import itertools
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+import numpy as np
+from decision_tree import DecisionTree
+
+# Grelhas de casos: cada preset é o produto cartesiano destas listas
+PRESETS = {
+    'quick': {'rows': [1000, 10000], 'features': [10], 'classes': [2], 'cardinality': [None, 16],
+              'criterion': ['entropy', 'gini', 'gain_ratio']},
+    'full': {'rows': [1000, 10000, 100000, 1000000], 'features': [10, 50], 'classes': [2, 10], 'cardinality': [None, 16],
+             'criterion': ['entropy', 'gini', 'gain_ratio']},
+}
+# Métricas comparadas com a baseline: True se um valor maior for melhor
+METRICS = {'fit_time': False, 'predict_rows_per_s': True, 'peak_memory_mb': False}
+# Parâmetros da execução (guardados em 'meta') que têm de ser iguais aos da baseline para os casos serem comparáveis
+RUN_PARAMS = ('max_depth', 'max_bins', 'repeat')
+
+
+def make_data(n_rows, n_features, n_classes, cardinality=None, seed=0):
+    # Dados sintéticos reprodutíveis: features contínuas (cardinality=None) ou inteiras com 'cardinality' valores diferentes,
+    # a classe depende de uma combinação linear de metade das features com ruído (as restantes são irrelevantes)
+    rng = np.random.default_rng(seed)
+    if cardinality is None:
+        X = rng.random((n_rows, n_features))
+    else:
+        X = rng.integers(0, cardinality, (n_rows, n_features)).astype(np.float64)
+    weights = np.zeros(n_features)
+    weights[:max(1, n_features // 2)] = rng.standard_normal(max(1, n_features // 2))
+    score = (X - X.mean(axis=0)) @ weights + 0.5 * rng.standard_normal(n_rows) * (np.abs(weights).sum() or 1)
+    # classes com a mesma frequência: quantis do score
+    y = np.searchsorted(np.quantile(score, np.linspace(0, 1, n_classes + 1)[1:-1]), score)
+    return X, y
+
+
+def case_name(case):
+    return ','.join(f'{key}={case[key]}' for key in sorted(case))
+
+
+def _measure(make_model, X, y, repeat):
+    # Melhor tempo do fit em 'repeat' execuções, débito do predict em todas as linhas e pico de memória do fit (num fit à parte,
+    # porque o tracemalloc torna as alocações mais lentas)
+    fit_times = []
+    for _ in range(repeat):
+        model = make_model()
+        start = time.perf_counter()
+        model.fit(X, y)
+        fit_times.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    model.predict(X)
+    predict_time = time.perf_counter() - start
+    tracemalloc.start()
+    make_model().fit(X, y)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return model, {
+        'fit_time': min(fit_times),
+        'predict_rows_per_s': len(X) / predict_time if predict_time > 0 else float('inf'),
+        'peak_memory_mb': peak / 2 ** 20,
+    }
+
+
+def run_case(case, max_depth=10, max_bins=None, repeat=3, sklearn=False):
+    # Executar um caso (dicionário com rows, features, classes, cardinality e criterion)
+    X, y = make_data(case['rows'], case['features'], case['classes'], case['cardinality'])
+    model, result = _measure(lambda: DecisionTree(criterion=case['criterion'], max_depth=max_depth, max_bins=max_bins),
+                             X, y, repeat)
+    result['n_nodes'] = int(len(model.feature_))
+    result['accuracy'] = float(np.mean(model.predict(X) == y))
+    if sklearn and case['criterion'] in ('entropy', 'gini'):
+        # Referência opcional: DecisionTreeClassifier do sklearn com a mesma profundidade
+        # (a profundidade da DecisionTree conta a partir de 0 e só para depois de max_depth, por isso max_depth + 1)
+        try:
+            from sklearn.tree import DecisionTreeClassifier
+        except ImportError:
+            print('sklearn não está instalado, a referência foi ignorada.')
+        else:
+            reference, metrics = _measure(lambda: DecisionTreeClassifier(criterion=case['criterion'], max_depth=max_depth + 1),
+                                          X, y, repeat)
+            metrics['n_nodes'] = int(reference.tree_.node_count)
+            result['sklearn'] = metrics
+    return result
+
+
+def compare(results, meta, baseline, tolerance):
+    # Comparar com uma baseline: uma regressão é uma métrica pior do que a baseline em mais do que 'tolerance' (fração).
+    # Os casos só são identificados pelos dados e pelo critério, por isso uma baseline com outros parâmetros da execução
+    # (p.ex. modo histograma contra modo exato) não é comparada: levanta ValueError
+    different = [key for key in RUN_PARAMS if baseline.get('meta', {}).get(key) != meta[key]]
+    if different:
+        details = ', '.join(f"{key}: {baseline.get('meta', {}).get(key)!r} -> {meta[key]!r}" for key in different)
+        raise ValueError(f'A baseline foi executada com outros parâmetros ({details}).')
+    previous = {entry['case']: entry for entry in baseline['results']}
+    regressions = []
+    for entry in results:
+        old = previous.get(entry['case'])
+        if old is None:
+            continue
+        for metric, higher_is_better in METRICS.items():
+            new_value, old_value = entry[metric], old[metric]
+            if higher_is_better:
+                worse = new_value < old_value * (1 - tolerance)
+            else:
+                worse = new_value > old_value * (1 + tolerance)
+            if worse:
+                regressions.append({'case': entry['case'], 'metric': metric, 'baseline': old_value, 'value': new_value})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark da DecisionTree')
+    parser.add_argument('--preset', choices=sorted(PRESETS), default='quick')
+    parser.add_argument('--rows', type=int, nargs='+', help='substitui as linhas do preset')
+    parser.add_argument('--features', type=int, nargs='+', help='substitui as features do preset')
+    parser.add_argument('--classes', type=int, nargs='+', help='substitui as classes do preset')
+    parser.add_argument('--cardinality', type=int, nargs='+', help='substitui as cardinalidades do preset (0 = contínuas)')
+    parser.add_argument('--criterion', nargs='+', choices=['entropy', 'gini', 'gain_ratio'], help='substitui os critérios do preset')
+    parser.add_argument('--max-depth', type=int, default=10)
+    parser.add_argument('--max-bins', type=int, default=None, help='modo histograma da DecisionTree')
+    parser.add_argument('--repeat', type=int, default=3, help='número de fits por caso (conta o melhor tempo)')
+    parser.add_argument('--output', help='ficheiro JSON com os resultados')
+    parser.add_argument('--baseline', help='ficheiro JSON de uma execução anterior para comparar')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='piora relativa aceite antes de assinalar uma regressão')
+    parser.add_argument('--sklearn', action='store_true', help='medir também o DecisionTreeClassifier do sklearn')
+    args = parser.parse_args(argv)
+
+    grid = dict(PRESETS[args.preset])
+    for key in ('rows', 'features', 'classes', 'criterion'):
+        if getattr(args, key):
+            grid[key] = getattr(args, key)
+    if args.cardinality:
+        grid['cardinality'] = [c or None for c in args.cardinality]
+
+    results = []
+    keys = sorted(grid)
+    for values in itertools.product(*(grid[key] for key in keys)):
+        case = dict(zip(keys, values))
+        result = run_case(case, args.max_depth, args.max_bins, args.repeat, args.sklearn)
+        result['case'] = case_name(case)
+        results.append(result)
+        print(f"{result['case']}: fit {result['fit_time']:.3f}s, predict {result['predict_rows_per_s']:.0f} linhas/s, "
+              f"memória {result['peak_memory_mb']:.1f} MB, {result['n_nodes']} nós")
+        if 'sklearn' in result:
+            reference = result['sklearn']
+            print(f"    sklearn: fit {reference['fit_time']:.3f}s, predict {reference['predict_rows_per_s']:.0f} linhas/s, "
+                  f"memória {reference['peak_memory_mb']:.1f} MB, {reference['n_nodes']} nós")
+
+    report = {
+        'meta': {'date': datetime.now().isoformat(timespec='seconds'), 'python': platform.python_version(),
+                 'numpy': np.__version__, 'platform': platform.platform(), 'max_depth': args.max_depth,
+                 'max_bins': args.max_bins, 'repeat': args.repeat},
+        'results': results,
+    }
+    if args.output:
+        try:
+            with open(args.output, 'w') as f:
+                json.dump(report, f, indent=2)
+        except IOError:
+            print(f'Erro ao escrever o ficheiro "{args.output}"')
+
+    if args.baseline:
+        try:
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        except FileNotFoundError:
+            print(f'Ficheiro "{args.baseline}" não encontrado.')
+            return 0
+        try:
+            regressions = compare(results, report['meta'], baseline, args.tolerance)
+        except ValueError as e:
+            print(e)
+            return 2
+        for r in regressions:
+            print(f"REGRESSÃO {r['case']} {r['metric']}: {r['baseline']:.4g} -> {r['value']:.4g}")
+        if regressions:
+            return 1
+        print('Sem regressões em relação à baseline.')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,25 +1,69 @@
+import heapq
+import json
+import os
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from sklearn.metrics import accuracy_score, precision_score
 
 class Node:
-    def __init__(self, feature_index=None, threshold=None, value=None, left=None, right=None):
-        self.feature_index = feature_index # índice da feature usada para a divisão
-        self.threshold = threshold # valor do limite usado para a divisão
-        self.value = value # valor do nó (elemento mais frequente ou média) se for folha
-        self.left = left # subárvore à esquerda do nó
-        self.right = right # subárvore à direita do nó
+    '''
+    Vista sobre um nó de uma árvore guardada em arrays paralelos (DecisionTree.feature_, threshold_, children_left_, ...).
+    Não guarda dados próprios: os atributos são lidos dos arrays, por isso percorrer e imprimir a árvore funciona como antes.
+
+    Argumentos:
+        - tree : DecisionTree -> árvore ajustada que contém os arrays
+        - index : int -> posição do nó nos arrays (0 é a raiz)
+    '''
+    def __init__(self, tree, index=0):
+        self.tree = tree
+        self.index = index
+
+    @property
+    def is_leaf(self):
+        return self.tree.children_left_[self.index] < 0
+
+    @property
+    def feature_index(self):
+        # índice da feature usada para a divisão
+        return None if self.is_leaf else int(self.tree.feature_[self.index])
+
+    @property
+    def threshold(self):
+        # valor do limite usado para a divisão
+        return None if self.is_leaf else self.tree.threshold_[self.index]
+
+    @property
+    def value(self):
+        # valor do nó (elemento mais frequente)
+        return self.tree.classes_[self.tree.value_[self.index]]
+
+    @property
+    def left(self):
+        # subárvore à esquerda do nó
+        return None if self.is_leaf else Node(self.tree, self.tree.children_left_[self.index])
+
+    @property
+    def right(self):
+        # subárvore à direita do nó
+        return None if self.is_leaf else Node(self.tree, self.tree.children_right_[self.index])
         
     def __repr__(self):
+        # Percorrer a árvore com uma pilha explícita (sem limite de recursão): as linhas saem pela mesma ordem da versão recursiva
+        # (nó, ramo True, subárvore esquerda, ramo False, subárvore direita)
         lines = []
-        def _helper(node, level):
-            if node is None:
-                return
+        stack = [('node', self, 0)]
+        while stack:
+            kind, node, level = stack.pop()
+            if kind == 'line':
+                lines.append(node)
+                continue
             lines.append('  ' * level + f'[{node.feature_index} ≤ {node.threshold}]')
             lines.append('  ' * (level + 1) + f'├─> [True: {node.left.value if node.left else None}]')
-            _helper(node.left, level + 2)
-            lines.append('  ' * (level + 1) + f'└─> [False: {node.right.value if node.right else None}]')
-            _helper(node.right, level + 2)
-        _helper(self, 0)
+            if node.right:
+                stack.append(('node', node.right, level + 2))
+            stack.append(('line', '  ' * (level + 1) + f'└─> [False: {node.right.value if node.right else None}]', None))
+            if node.left:
+                stack.append(('node', node.left, level + 2))
         return '\n'.join(lines)
 
 
@@ -27,158 +71,543 @@ class Node:
 def _most_common_label(y):
     # Retornar o elemento mais frequente no vetor y
     unique, counts = np.unique(y, return_counts=True)
-    # Obter os índices dos elementos com a maior contagem
-    max_indices = np.argwhere(counts == counts.max()).flatten()
-    # Se houver mais de um elemento com a maior contagem, escolher um aleatoriamente 
-    if len(max_indices) > 1:
-        max_index = np.random.choice(max_indices)
-    else:
-        max_index = max_indices[0]
-    return unique[max_index]
-
-def _entropy(y):
-    # Calcular a entropia de um vetor y
-    # Quanto maior a entropia, maior a incerteza da previsão, logo o objetivo é reduzir a entropia
-
-    # Obtemos o vetor com os elementos de y sem repetições e o número de vezes que cada um desses elementos aparece em y:
-    unique, counts = np.unique(y, return_counts=True)
-
-    probabilities = counts / counts.sum()
-    entropy = sum(probabilities * -np.log2(probabilities))
-    return entropy
-
-def _gini_index(y):
-    # Calcular o índice de Gini de um vetor y
-    # Quanto maior o índice de Gini, maior a impureza do conjunto, logo o objetivo é reduzir o índice de Gini
-
-    # Obtemos o vetor com os elementos de y sem repetições e o número de vezes que cada um desses elementos aparece em y:
-    unique, counts = np.unique(y, return_counts=True)
-
-    probabilities = counts / counts.sum()
-    gini_index = 1 - sum(probabilities**2)
-    return gini_index
-
-def _information_gain(y, X_column, threshold, criterion):
-    # Calcular o ganho de informação de um critério de divisão usando a entropia ou gini como medida de impureza
-    if criterion == 'entropy':
-        parent = _entropy(y)
-    elif criterion == 'gini':
-        parent = _gini_index(y)
-    # Dividir o vetor X_column em dois subconjuntos
-    left_indices, right_indices = _split(X_column, threshold)
-
-    if len(left_indices) == 0 or len(right_indices) == 0:
-        return 0
-
-    # Calcular a entropia/gini ponderada dos subconjuntos
+    # Se houver mais de um elemento com a maior contagem fica o menor (o resultado não depende do gerador aleatório
+    # nem do número de workers)
+    return unique[np.argmax(counts)]
+
+def _impurity(counts, criterion):
+    # Calcular a entropia ou o índice de Gini a partir das contagens por classe (uma linha de 'counts' por conjunto)
+    # Quanto maior a entropia/Gini, maior a incerteza da previsão, logo o objetivo é reduzi-los
+    n = counts.sum(axis=-1, keepdims=True)
+    probabilities = np.divide(counts, n, out=np.zeros(counts.shape), where=n > 0)
+    if criterion == 'gini':
+        return 1 - (probabilities ** 2).sum(axis=-1)
+    log_p = np.log2(probabilities, out=np.zeros(counts.shape), where=probabilities > 0)
+    return -(probabilities * log_p).sum(axis=-1)
+
+def _split_gains(X_column, y, n_classes, criterion):
+    # Avaliar todos os limites possíveis de uma feature numa única passagem:
+    # ordenar a coluna uma vez e percorrer a ordem com as contagens acumuladas de cada classe.
+    # O limite i (valor xs[i]) põe à esquerda as amostras com valor <= xs[i]; só são candidatos os limites com as duas partes não vazias
+    order = np.argsort(X_column, kind='stable')
+    xs = X_column[order]
+    candidates = np.flatnonzero(xs[:-1] != xs[1:])
+    if len(candidates) == 0:
+        return None, None
+    onehot = np.zeros((len(y), n_classes))
+    onehot[np.arange(len(y)), y[order]] = 1
+    cumulative = np.cumsum(onehot, axis=0)
+    total = cumulative[-1]
+    left = cumulative[candidates]
+    right = total - left
     n = len(y)
-    len_left, len_right = len(left_indices), len(right_indices)
-    if criterion == 'entropy':
-        left, right = _entropy(y[left_indices]), _entropy(y[right_indices])
-    elif criterion == 'gini':
-        left, right = _gini_index(y[left_indices]), _gini_index(y[right_indices])
-
-    child = (len_left / n) * left + (len_right / n) * right
-
-    # Calcular o ganho de informação
-    ig = parent - child
-    return ig
-
-def _gain_ratio(y, X_column, threshold):
-    # Calcular a razão de ganho de um critério de divisão usando o ganho de informação e a entropia do atributo como medidas
-    info_gain = _information_gain(y, X_column, threshold, 'entropy')
-
-    # Dividir o vetor X_column em dois subconjuntos
-    left_indices, right_indices = _split(X_column, threshold)
-
-    if len(left_indices) == 0 or len(right_indices) == 0:
-        return 0
-
-    # Calcular a entropia do atributo
-    n = len(y)
-    n_left, n_right = len(left_indices), len(right_indices)
-    p_left, p_right = n_left / n, n_right / n
-    attr_entropy = -p_left * np.log2(p_left) - p_right * np.log2(p_right)
-
-    # Calcular a razão de ganho
-    gain_ratio = info_gain / attr_entropy
-    return gain_ratio
-
-def _split(X_column, threshold):
-    # Dividir um vetor X_column em dois subconjuntos baseados num limite
-    left_indices = np.argwhere(X_column <= threshold).flatten()
-    right_indices = np.argwhere(X_column > threshold).flatten()
-    return left_indices, right_indices
-
-
-
+    n_left = candidates + 1
+    n_right = n - n_left
+    # Calcular a entropia/gini ponderada dos subconjuntos e o ganho de informação
+    impurity = 'gini' if criterion == 'gini' else 'entropy'
+    parent = _impurity(total, impurity)
+    child = (n_left / n) * _impurity(left, impurity) + (n_right / n) * _impurity(right, impurity)
+    gains = parent - child
+    if criterion == 'gain_ratio':
+        # razão de ganho: ganho de informação a dividir pela entropia do atributo
+        p_left, p_right = n_left / n, n_right / n
+        attr_entropy = -p_left * np.log2(p_left) - p_right * np.log2(p_right)
+        gains = gains / attr_entropy
+    return xs[candidates], gains
+
+def _max_features(max_features, n_features):
+    # Número de features candidatas em cada nó
+    if max_features is None:
+        return n_features
+    if max_features == 'sqrt':
+        return max(1, int(np.sqrt(n_features)))
+    if max_features == 'log2':
+        return max(1, int(np.log2(n_features)))
+    if isinstance(max_features, float):
+        if not 0 < max_features <= 1:
+            raise ValueError("max_features as a fraction must be in (0, 1]")
+        return max(1, int(max_features * n_features))
+    if isinstance(max_features, (int, np.integer)) and max_features >= 1:
+        return min(int(max_features), n_features)
+    raise ValueError("Invalid max_features: {}".format(max_features))
+
+def _bin_edges(X_column, max_bins):
+    # Limites dos bins de uma feature: se houver no máximo max_bins valores diferentes cada valor fica no seu bin,
+    # caso contrário os limites são quantis da coluna (no máximo max_bins - 1 limites)
+    values = np.unique(X_column)
+    if len(values) <= max_bins:
+        return values[:-1]
+    return np.unique(np.quantile(X_column, np.linspace(0, 1, max_bins + 1)[1:-1]))
+
+def _histogram_gains(hist, criterion):
+    # Avaliar todos os limites de todas as features a partir dos histogramas de classes do nó (features x bins x classes):
+    # o limite b põe à esquerda os bins 0..b, as contagens da esquerda são a soma acumulada dos bins
+    cumulative = np.cumsum(hist, axis=1)
+    total = cumulative[:, -1:, :]
+    left = cumulative[:, :-1, :]
+    right = total - left
+    n = total.sum(axis=-1)
+    n_left, n_right = left.sum(axis=-1), right.sum(axis=-1)
+    impurity = 'gini' if criterion == 'gini' else 'entropy'
+    with np.errstate(divide='ignore', invalid='ignore'):
+        parent = _impurity(total, impurity)
+        child = (n_left / n) * _impurity(left, impurity) + (n_right / n) * _impurity(right, impurity)
+        gains = parent - child
+        if criterion == 'gain_ratio':
+            p_left, p_right = n_left / n, n_right / n
+            attr_entropy = -p_left * np.log2(p_left) - p_right * np.log2(p_right)
+            gains = gains / attr_entropy
+    # só são candidatos os limites com as duas partes não vazias
+    return np.where((n_left > 0) & (n_right > 0), gains, -np.inf)
+
+
+
+
+# Versão do formato binário usado por DecisionTree.save/load
+FORMAT_VERSION = 1
+# Profundidade máxima exportada como if/else encaixados (o Python aceita no máximo 100 níveis de indentação)
+EXPORT_MAX_DEPTH = 50
+# Parâmetros guardados no cabeçalho do formato binário
+_PARAMS = ('criterion', 'max_depth', 'min_samples_split', 'max_leaf_nodes', 'max_bins', 'min_impurity_decrease',
+           'n_jobs', 'max_features')
+
+def _compact(values):
+    # Guardar inteiros não negativos (ou -1 nas folhas) com o menor tipo que os representa
+    values = np.asarray(values)
+    if len(values) == 0:
+        return values.astype(np.int8)
+    return values.astype(np.result_type(np.min_scalar_type(values.min()), np.min_scalar_type(values.max())))
+
+# Nós com menos amostras do que este valor são avaliados em série (perto das folhas o custo de distribuir o trabalho é maior do que o ganho)
+PARALLEL_MIN_SAMPLES = 10000
 
 class DecisionTree:
-    def __init__(self, criterion='entropy', max_depth=None, min_samples_split=2, max_leaf_nodes=20):
+    def __init__(self, criterion='entropy', max_depth=None, min_samples_split=2, max_leaf_nodes=None, max_bins=None,
+                 min_impurity_decrease=0.0, n_jobs=1, max_features=None, random_state=None):
         self.criterion = criterion  # critério de divisão: 'entropy', 'gini' ou 'gain_ratio'
-        self.max_depth = max_depth
+        self.max_depth = max_depth # profundidade máxima (None -> sem limite)
         self.min_samples_split = min_samples_split # número mínimo de amostras para dividir um nó (para pre-prunning -> Size Cutof)
-        self.max_leaf_nodes = max_leaf_nodes # número máximo de leaf nodes na árvore (para pre-prunning -> Maximum Depth Cutof)
-
-    def fit(self, X, y):
-        self.tree_, leafs = self._grow_tree(X, y, 0)
+        self.max_leaf_nodes = max_leaf_nodes # número máximo de leaf nodes na árvore; se for dado a árvore cresce "best-first" (None -> sem limite)
+        self.max_bins = max_bins # modo histograma: cada feature é quantizada em no máximo max_bins (<= 255) bins antes do treino
+        self.min_impurity_decrease = min_impurity_decrease # um nó só é dividido se a redução ponderada da impureza for pelo menos este valor
+        self.n_jobs = n_jobs # número de threads usadas na procura de divisões (-1 usa todos os cores)
+        self.max_features = max_features # features candidatas em cada nó: None (todas), int, fração (float), 'sqrt' ou 'log2'
+        self.random_state = random_state # semente (ou np.random.Generator) da escolha das features candidatas
+
+    def fit(self, X, y, sample_indices=None):
+        # sample_indices: linhas de X usadas no treino (podem repetir-se, p.ex. uma amostra bootstrap); None usa todas.
+        # As linhas são lidas diretamente de X através dos índices, sem copiar a amostra
+        X = np.asarray(X)
+        y = np.asarray(y)
+        if sample_indices is None:
+            samples = np.arange(X.shape[0])
+        else:
+            samples = np.array(sample_indices, dtype=np.intp)
+        # As classes são codificadas uma única vez (0..n_classes-1) para as contagens por classe da procura de divisões
+        # (só as classes da amostra; as linhas fora da amostra nunca são lidas)
+        self.classes_, codes = np.unique(y[samples], return_inverse=True)
+        y = np.zeros(len(y), dtype=np.intp)
+        y[samples] = codes
+        if self.max_bins is not None:
+            # Modo histograma: quantizar cada feature uma única vez em códigos uint8 (8x menos memória que float64)
+            if not 2 <= self.max_bins <= 255:
+                raise ValueError("max_bins must be between 2 and 255")
+            self.bin_edges_ = [_bin_edges(X[samples, f], self.max_bins) for f in range(X.shape[1])]
+            X = self._bin(X)
+        self._rng = np.random.default_rng(self.random_state)
+        # A árvore é guardada em arrays paralelos, um elemento por nó (as folhas têm filhos -1)
+        self._nodes = {'feature': [], 'threshold': [], 'left': [], 'right': [], 'value': [], 'counts': []}
+        if self.max_leaf_nodes is not None and self.max_leaf_nodes < 1:
+            raise ValueError("max_leaf_nodes must be at least 1")
+        # cópia única de X por colunas (ordem Fortran): a procura de divisões lê sempre colunas inteiras
+        # (sem cópia se X já estiver em ordem Fortran, p.ex. a matriz partilhada da RandomForest)
+        X = np.asfortranarray(X)
+        # número de amostras de treino, usado na redução ponderada da impureza
+        self._n_train = len(samples)
+        # As features de um nó são avaliadas num conjunto de threads: as operações do numpy (argsort, cumsum, bincount)
+        # libertam o GIL e as threads leem o mesmo X sem cópias
+        n_jobs = os.cpu_count() if self.n_jobs == -1 else self.n_jobs
+        self._pool = ThreadPoolExecutor(max_workers=n_jobs) if n_jobs > 1 else None
+        try:
+            if self.max_leaf_nodes is None:
+                leafs = self._grow_tree(X, y, samples)
+            else:
+                leafs = self._grow_best_first(X, y, samples)
+        finally:
+            if self._pool is not None:
+                self._pool.shutdown()
+            del self._pool, self._rng, self._n_train
         #print(leafs)
+        nodes = self._nodes
+        del self._nodes
+        self.feature_ = np.array(nodes['feature'], dtype=np.intp)
+        self.threshold_ = np.array(nodes['threshold'], dtype=np.float64)
+        self.children_left_ = np.array(nodes['left'], dtype=np.intp)
+        self.children_right_ = np.array(nodes['right'], dtype=np.intp)
+        self.value_ = np.array(nodes['value'], dtype=np.intp)
+        self.class_counts_ = np.array(nodes['counts'], dtype=np.int64).reshape(-1, len(self.classes_))
+        self.n_features_in_ = X.shape[1]
+        self.tree_ = Node(self, 0)
+        return self
+
+    def save(self, dirname):
+        # Guardar a árvore ajustada em formato binário: uma pasta com um ficheiro .npy por array dos nós e um cabeçalho JSON.
+        # Os inteiros são guardados com o menor tipo possível (int8/int16/int32) e não há objetos Python a reconstruir
+        try:
+            os.makedirs(dirname, exist_ok=True)
+            classes = self.classes_.astype(str) if self.classes_.dtype == object else self.classes_
+            arrays = {
+                'feature': _compact(self.feature_),
+                'threshold': self.threshold_,
+                'children_left': _compact(self.children_left_),
+                'children_right': _compact(self.children_right_),
+                'value': _compact(self.value_),
+                'class_counts': _compact(self.class_counts_),
+                'classes': classes,
+            }
+            # os parâmetros podem ser escalares do numpy (p.ex. np.int64), que o json não aceita
+            params = {name: getattr(self, name) for name in _PARAMS}
+            params = {name: value.item() if isinstance(value, np.generic) else value for name, value in params.items()}
+            header = {
+                'version': FORMAT_VERSION,
+                'n_nodes': len(self.feature_),
+                'n_features': int(self.n_features_in_),
+                'params': params,
+                'dtypes': {name: str(values.dtype) for name, values in arrays.items()},
+            }
+            # o cabeçalho é convertido antes de escrever os arrays e escrito no fim: uma pasta sem header.json está incompleta
+            header = json.dumps(header, indent=2)
+            for name, values in arrays.items():
+                np.save(os.path.join(dirname, name + '.npy'), np.ascontiguousarray(values))
+            with open(os.path.join(dirname, 'header.json'), 'w') as f:
+                f.write(header)
+        except IOError:
+            print(f'Erro ao escrever a pasta "{dirname}"')
+
+    def load(self, dirname, mmap_mode='r'):
+        # Abrir uma árvore guardada com save() usando np.memmap: o carregamento não lê os nós, só são lidas as páginas usadas na previsão
+        # Com mmap_mode=None os arrays são lidos para memória
+        try:
+            with open(os.path.join(dirname, 'header.json'), 'r') as f:
+                header = json.load(f)
+            if header.get('version') != FORMAT_VERSION:
+                raise ValueError(f'Versão do formato não suportada: {header.get("version")}')
+            for name, value in header['params'].items():
+                setattr(self, name, value)
+            load = lambda name: np.load(os.path.join(dirname, name + '.npy'), mmap_mode=mmap_mode)
+            self.feature_ = load('feature')
+            self.threshold_ = load('threshold')
+            self.children_left_ = load('children_left')
+            self.children_right_ = load('children_right')
+            self.value_ = load('value')
+            self.class_counts_ = load('class_counts')
+            self.classes_ = load('classes')
+            self.n_features_in_ = header['n_features']
+            self.tree_ = Node(self, 0)
+        except FileNotFoundError:
+            print(f'Pasta "{dirname}" não encontrada.')
+        return self
+
+    def _depth(self):
+        # Profundidade da árvore (0 se só tiver a raiz), calculada sem recursão
+        depth = np.zeros(len(self.children_left_), dtype=np.intp)
+        for node in range(len(depth)):
+            # os filhos são sempre criados depois do pai, por isso a profundidade do pai já é conhecida
+            if self.children_left_[node] >= 0:
+                depth[self.children_left_[node]] = depth[self.children_right_[node]] = depth[node] + 1
+        return int(depth.max())
+
+    def export_python(self, function_name='predict_tree'):
+        # Gerar o código de uma função Python para prever uma amostra (lista ou array com as features), sem numpy.
+        # Árvores com profundidade até EXPORT_MAX_DEPTH dão só if/else encaixados (a forma com menor latência por linha);
+        # árvores mais profundas passariam o limite de indentação do Python, por isso os nós ficam em tuplos constantes
+        # percorridos por um ciclo while. O resultado pode ser executado com exec() ou guardado num ficheiro .py
+        if self._depth() > EXPORT_MAX_DEPTH:
+            leaf = self.children_left_ < 0
+            feature = tuple(np.where(leaf, 0, self.feature_).tolist())
+            threshold = tuple(np.where(leaf, 0.0, self.threshold_).tolist())
+            values = tuple(self.classes_[self.value_].tolist())
+            return '\n'.join([
+                f'def {function_name}(x):',
+                f'    feature = {feature!r}',
+                f'    threshold = {threshold!r}',
+                f'    left = {tuple(np.asarray(self.children_left_).tolist())!r}',
+                f'    right = {tuple(np.asarray(self.children_right_).tolist())!r}',
+                f'    values = {values!r}',
+                '    node = 0',
+                '    while left[node] >= 0:',
+                '        node = left[node] if x[feature[node]] <= threshold[node] else right[node]',
+                '    return values[node]',
+            ]) + '\n'
+        lines = [f'def {function_name}(x):']
+        stack = [('node', 0, 1)]
+        while stack:
+            kind, node, level = stack.pop()
+            indent = '    ' * level
+            if kind == 'else':
+                lines.append(indent + 'else:')
+            elif self.children_left_[node] < 0:
+                lines.append(indent + f'return {self.classes_[self.value_[node]].item()!r}')
+            else:
+                lines.append(indent + f'if x[{int(self.feature_[node])}] <= {float(self.threshold_[node])!r}:')
+                stack.append(('node', self.children_right_[node], level + 1))
+                stack.append(('else', None, level))
+                stack.append(('node', self.children_left_[node], level + 1))
+        return '\n'.join(lines) + '\n'
+
+    def export_numpy(self, function_name='predict_tree'):
+        # Gerar o código de uma função vetorial para uma matriz X: cada nó tem uma máscara com as linhas que chegam a ele,
+        # calculada a partir da máscara do pai e de uma comparação de uma coluna inteira (o código cresce com o número de nós,
+        # não com folhas x profundidade). As máscaras das folhas são resolvidas com um único np.select.
+        # O código gerado usa o nome 'np' (executar com exec(codigo, {'np': numpy}))
+        lines = [f'def {function_name}(X):', '    X = np.asarray(X)', '    m0 = np.ones(len(X), dtype=bool)']
+        leaves, values = [], []
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            if self.children_left_[node] < 0:
+                leaves.append(f'm{node}')
+                values.append(self.classes_[self.value_[node]].item())
+                continue
+            left, right = self.children_left_[node], self.children_right_[node]
+            lines.append(f'    c = X[:, {int(self.feature_[node])}] <= {float(self.threshold_[node])!r}')
+            lines.append(f'    m{left} = m{node} & c')
+            lines.append(f'    m{right} = m{node} & ~c')
+            # a máscara de um nó interno já não é precisa depois de calcular as dos filhos
+            lines.append(f'    del m{node}')
+            stack.append(right)
+            stack.append(left)
+        # o np.select escolhe o número da folha e o valor da folha é lido de um array
+        lines.append(f'    values = np.array({values!r})')
+        lines.append('    return values[np.select([')
+        lines += [f'        {leaf},' for leaf in leaves]
+        lines.append(f'    ], np.arange({len(values)}))]')
+        return '\n'.join(lines) + '\n'
+
+    def _add_node(self, y):
+        # Acrescentar um nó (inicialmente folha) aos arrays da árvore e devolver a sua posição
+        nodes = self._nodes
+        nodes['feature'].append(-1)
+        nodes['threshold'].append(np.nan)
+        nodes['left'].append(-1)
+        nodes['right'].append(-1)
+        nodes['value'].append(_most_common_label(y))
+        nodes['counts'].append(np.bincount(y, minlength=len(self.classes_)))
+        return len(nodes['feature']) - 1
+
+    def _bin(self, X):
+        # Converter os valores originais em códigos dos bins: o código b corresponde a edges[b-1] < x <= edges[b],
+        # por isso 'código <= b' é o mesmo que 'x <= edges[b]' e os limites guardados nos nós são os valores reais
+        X_binned = np.empty(X.shape, dtype=np.uint8, order='F')
+        for f, edges in enumerate(self.bin_edges_):
+            X_binned[:, f] = np.searchsorted(edges, X[:, f], side='left')
+        return X_binned
+
+    def _map_features(self, func, feature_indices, n_samples):
+        # Aplicar func a cada feature, em paralelo se houver um conjunto de threads e o nó for grande.
+        # Os resultados vêm sempre pela ordem das features, por isso a árvore não depende do número de workers
+        if self._pool is None or n_samples < PARALLEL_MIN_SAMPLES or len(feature_indices) < 2:
+            return [func(f) for f in feature_indices]
+        return list(self._pool.map(func, feature_indices))
+
+    def _histograms(self, X_binned, y, samples):
+        # Histogramas de classes de cada feature nas amostras do nó (features x bins x classes), um bincount por feature
+        n_classes = len(self.classes_)
+        hist = np.empty((X_binned.shape[1], self.max_bins, n_classes))
+
+        def feature_histogram(f):
+            codes = X_binned[samples, f].astype(np.intp) * n_classes + y
+            hist[f] = np.bincount(codes, minlength=self.max_bins * n_classes).reshape(self.max_bins, n_classes)
+
+        self._map_features(feature_histogram, range(X_binned.shape[1]), len(samples))
+        return hist
+
+    def _best_hist_criteria(self, hist, feature_indices):
+        if self.criterion not in ('entropy', 'gini', 'gain_ratio'):
+            raise ValueError("Invalid criterion: {}".format(self.criterion))
+        # os histogramas existem para todas as features (subtração entre irmãos), só as features candidatas são avaliadas
+        gains = _histogram_gains(hist[feature_indices], self.criterion)
+        # argmax na matriz (features x limites): em caso de empate fica a primeira feature e o menor limite
+        best = np.argmax(gains)
+        row, bin_index = np.unravel_index(best, gains.shape)
+        if gains[row, bin_index] == -np.inf:
+            return None, None, None
+        return feature_indices[row], bin_index, gains[row, bin_index]
+
+    def apply(self, X):
+        # Índice da folha de cada amostra: todas as amostras avançam um nível de cada vez com operações vetoriais
+        # (as amostras que já chegaram a uma folha saem do conjunto ativo)
+        X = np.asarray(X)
+        nodes = np.zeros(X.shape[0], dtype=np.intp)
+        active = np.arange(X.shape[0]) if self.children_left_[0] >= 0 else np.empty(0, dtype=np.intp)
+        while len(active):
+            current = nodes[active]
+            go_left = X[active, self.feature_[current]] <= self.threshold_[current]
+            nodes[active] = np.where(go_left, self.children_left_[current], self.children_right_[current])
+            active = active[self.children_left_[nodes[active]] >= 0]
+        return nodes
 
     def predict(self, X):
-        return [self._predict(inputs) for inputs in X]
-
-    def _grow_tree(self, X, y, depth):
+        return self.classes_[self.value_[self.apply(X)]]
+
+    def predict_proba(self, X):
+        # Probabilidade de cada classe (colunas pela ordem de classes_) a partir das contagens de treino da folha
+        counts = self.class_counts_[self.apply(X)]
+        return counts / counts.sum(axis=1, keepdims=True)
+
+    def _feature_indices(self, n_features):
+        # Features candidatas de um nó: todas, ou um subconjunto aleatório de max_features (ordenado) escolhido em cada nó
+        k = _max_features(self.max_features, n_features)
+        if k >= n_features:
+            return np.arange(n_features)
+        return np.sort(self._rng.choice(n_features, k, replace=False))
+
+    def _evaluate(self, X, y, samples, node, depth, hist):
+        # Procurar a melhor divisão do nó que ocupa o intervalo 'samples' do vetor de índices.
+        # Devolve None se o nó tiver de ser uma folha, senão (redução ponderada da impureza, feature, limite, bin, histogramas)
+        n_node = len(samples)
+        n_labels = np.count_nonzero(self._nodes['counts'][node])
+        if ((self.max_depth is not None and depth > self.max_depth) or n_labels == 1 or n_node < self.min_samples_split):
+            return None
+        y_node = y[samples]
+        best_bin = None
+        feature_indices = self._feature_indices(X.shape[1])
+        if self.max_bins is not None:
+            # Modo histograma: os histogramas do nó vêm do pai (ou são calculados na raiz)
+            if hist is None:
+                hist = self._histograms(X, y_node, samples)
+            best_feature, best_bin, gain = self._best_hist_criteria(hist, feature_indices)
+            if best_feature is not None:
+                best_threshold = self.bin_edges_[best_feature][best_bin]
+        else:
+            best_feature, best_threshold, gain = self._best_criteria(X, y_node, samples, feature_indices)
+        # Se nenhuma feature permite dividir (todas constantes neste nó) o nó é uma folha
+        if best_feature is None:
+            return None
+        # redução da impureza ponderada pela fração de amostras de treino que chegam ao nó
+        decrease = n_node / self._n_train * gain
+        if decrease < self.min_impurity_decrease:
+            return None
+        return decrease, best_feature, best_threshold, best_bin, hist
+
+    def _split_node(self, X, y, samples, node, start, end, split):
+        # Dividir o nó: reorganizar o intervalo [start, end) do vetor de índices (esquerda primeiro) e guardar a divisão nos arrays.
+        # Devolve o fim da parte esquerda e os histogramas dos dois filhos (modo histograma)
+        _, best_feature, best_threshold, best_bin, hist = split
+        node_samples = samples[start:end]
+        if self.max_bins is not None:
+            go_left = X[node_samples, best_feature] <= best_bin
+        else:
+            go_left = X[node_samples, best_feature] <= best_threshold
+        mid = start + np.count_nonzero(go_left)
+        samples[start:end] = np.concatenate([node_samples[go_left], node_samples[~go_left]])
+
+        left_hist = right_hist = None
+        if self.max_bins is not None:
+            # Só o histograma do filho mais pequeno é calculado, o do maior é a diferença para o histograma do pai
+            if mid - start <= end - mid:
+                left_hist = self._histograms(X, y[samples[start:mid]], samples[start:mid])
+                right_hist = hist - left_hist
+            else:
+                right_hist = self._histograms(X, y[samples[mid:end]], samples[mid:end])
+                left_hist = hist - right_hist
+
+        self._nodes['feature'][node] = best_feature
+        self._nodes['threshold'][node] = best_threshold
+        return mid, left_hist, right_hist
+
+    def _grow_tree(self, X, y, samples):
+        # Crescimento em profundidade, iterativo com uma pilha explícita (sem limite de recursão).
+        # Todos os nós partilham um único vetor de índices das amostras: cada nó corresponde ao intervalo [start, end)
+        # e a divisão reorganiza esse intervalo no próprio vetor (esquerda primeiro), sem copiar X.
+        # A ordem dos nós nos arrays é a mesma da versão recursiva (nó, subárvore esquerda, subárvore direita)
+        nodes = self._nodes
         n_leafs = 0
-        n_samples, n_features = X.shape
-        n_labels = len(np.unique(y))
-        if (depth > self.max_depth or n_labels == 1 or n_samples < self.min_samples_split or n_leafs >= self.max_leaf_nodes):
-            leaf_value = _most_common_label(y)
-            return Node(value=leaf_value), 1
-        feature_indices = np.arange(n_features)
-        best_feature, best_threshold = self._best_criteria(X, y, feature_indices)
-        left_indices, right_indices = _split(X[:, best_feature], best_threshold)
-
-        left,left_leaf = self._grow_tree(X[left_indices, :], y[left_indices], depth+1) 
-        right,right_leaf = self._grow_tree(X[right_indices, :], y[right_indices], depth+1)
-
-        n_leafs += (left_leaf + right_leaf)
-
-        # Atribuir um valor ao nó usando o método _most_common_label
-        node_value = _most_common_label(y)
-        return Node(best_feature, best_threshold, node_value, left, right), n_leafs
+        # cada elemento da pilha: (pai, lado, start, end, profundidade, histogramas do nó)
+        stack = [(-1, None, 0, len(samples), 0, None)]
+        while stack:
+            parent, side, start, end, depth, hist = stack.pop()
+            node = self._add_node(y[samples[start:end]])
+            if parent >= 0:
+                nodes[side][parent] = node
+            split = self._evaluate(X, y, samples[start:end], node, depth, hist)
+            if split is None:
+                n_leafs += 1
+                continue
+            mid, left_hist, right_hist = self._split_node(X, y, samples, node, start, end, split)
+            # a direita entra primeiro na pilha para a esquerda ser tratada antes
+            stack.append((node, 'right', mid, end, depth + 1, right_hist))
+            stack.append((node, 'left', start, mid, depth + 1, left_hist))
+        return n_leafs
+
+    def _grow_best_first(self, X, y, samples):
+        # Crescimento "best-first" (usado quando max_leaf_nodes é dado): as folhas que podem ser divididas ficam numa fila
+        # de prioridade ordenada pela redução ponderada da impureza e é sempre dividida a melhor, até haver max_leaf_nodes folhas.
+        # Em caso de empate é dividida a folha criada primeiro.
+        # A fila só guarda a divisão escolhida (escalares): no modo histograma os histogramas do nó (features x bins x classes)
+        # são calculados de novo quando o nó sai da fila, para a memória não crescer com o número de folhas na fila
+        nodes = self._nodes
+        heap = []
+        counter = 0
+
+        def push(node, start, end, depth, hist):
+            nonlocal counter
+            split = self._evaluate(X, y, samples[start:end], node, depth, hist)
+            if split is not None:
+                heapq.heappush(heap, (-split[0], counter, node, start, end, depth, split[:4]))
+                counter += 1
+
+        push(self._add_node(y[samples]), 0, len(samples), 0, None)
+        n_leafs = 1
+        while heap and n_leafs < self.max_leaf_nodes:
+            _, _, node, start, end, depth, split = heapq.heappop(heap)
+            hist = None
+            if self.max_bins is not None:
+                hist = self._histograms(X, y[samples[start:end]], samples[start:end])
+            mid, left_hist, right_hist = self._split_node(X, y, samples, node, start, end, split + (hist,))
+            left = self._add_node(y[samples[start:mid]])
+            right = self._add_node(y[samples[mid:end]])
+            nodes['left'][node], nodes['right'][node] = left, right
+            n_leafs += 1
+            push(left, start, mid, depth + 1, left_hist)
+            push(right, mid, end, depth + 1, right_hist)
+        return n_leafs
 
     def _predict(self, inputs):
+        # Previsão de uma única amostra (a mesma regra 'x <= limite' usada na divisão)
         node = self.tree_
-        if node is None:
-            return None
         while node.left:
-            if inputs[node.feature_index] < node.threshold:
+            if inputs[node.feature_index] <= node.threshold:
                 node = node.left
             else:
                 node = node.right
         return node.value
 
-    def _best_criteria(self, X, y, feature_indices):
+    def _best_criteria(self, X, y, samples, feature_indices):
+        if self.criterion not in ('entropy', 'gini', 'gain_ratio'):
+            raise ValueError("Invalid criterion: {}".format(self.criterion))
         best_gain = -1
         split_index, split_threshold = None, None
+        n_classes = len(self.classes_)
         #para cada feature (coluna) vemos qual a melhor feature para dividir a árvore e nessa feature qual o melhor limite a ser usado para a divisão
         #se limite = 0.5, de um lado ficam com a caracteristica menor ou igual a 0.5 e do outro maior que 0.5
-        for feature_index in feature_indices:
-            X_column = X[:, feature_index]
-            thresholds = np.unique(X_column)
-            for threshold in thresholds:
-                if self.criterion == 'entropy' or self.criterion == 'gini':
-                    gain = _information_gain(y, X_column, threshold, self.criterion)
-                elif self.criterion == 'gain_ratio':
-                    gain = _gain_ratio(y, X_column, threshold)
-                else:
-                    raise ValueError("Invalid criterion: {}".format(self.criterion))
-                if gain > best_gain:
-                    best_gain = gain
-                    split_index = feature_index
-                    split_threshold = threshold
-
-        return split_index, split_threshold
+        #todos os limites de uma feature são avaliados de uma vez (_split_gains), em caso de empate fica o menor limite
+        def feature_split(feature_index):
+            thresholds, gains = _split_gains(X[samples, feature_index], y, n_classes, self.criterion)
+            if thresholds is None:
+                return None, None
+            best = np.argmax(gains)
+            return thresholds[best], gains[best]
+
+        #as features podem ser avaliadas em paralelo, a escolha é feita depois pela ordem das features (empate -> primeira feature)
+        results = self._map_features(feature_split, feature_indices, len(samples))
+        for feature_index, (threshold, gain) in zip(feature_indices, results):
+            if threshold is not None and gain > best_gain:
+                best_gain = gain
+                split_index = feature_index
+                split_threshold = threshold
+
+        return split_index, split_threshold, best_gain
     
 # Classe de teste
 class TestDecisionTree():
@@ -209,9 +638,36 @@ class TestDecisionTree():
         prec = precision_score(y_test, y_pred)
         print("Acurácia:", acc, "\nPrecisão:", prec)
 
+    def test_save_load(self):
+        # Guardar a árvore em formato binário, abrir com np.memmap e comparar com as funções geradas
+        import shutil, tempfile
+        X = np.random.rand(200, 4)
+        y = np.where(X[:, 0] > X[:, 1], 'a', 'b')
+        dt = DecisionTree(max_depth=5).fit(X, y)
+        dirname = tempfile.mkdtemp()
+        dt.save(dirname)
+        loaded = DecisionTree().load(dirname)
+        print("Previsões iguais depois do load:", np.array_equal(dt.predict(X), loaded.predict(X)))
+        namespace = {'np': np}
+        exec(dt.export_python('predict_row'), namespace)
+        exec(dt.export_numpy('predict_batch'), namespace)
+        print("Função Python gerada igual:", [namespace['predict_row'](row) for row in X] == list(dt.predict(X)))
+        print("Função np.select gerada igual:", np.array_equal(namespace['predict_batch'](X), dt.predict(X)))
+        shutil.rmtree(dirname)
+        # Árvore muito profunda (uma divisão por nível): a função Python gerada não pode usar if/else encaixados
+        X = np.arange(600, dtype=float)[:, None]
+        y = np.arange(600) % 2
+        deep = DecisionTree().fit(X, y)
+        exec(deep.export_python('predict_deep'), namespace)
+        exec(deep.export_numpy('predict_deep_batch'), namespace)
+        print("Árvore com profundidade", deep._depth(), "- função Python gerada igual:",
+              [namespace['predict_deep'](row) for row in X] == list(deep.predict(X)),
+              "- np.select igual:", np.array_equal(namespace['predict_deep_batch'](X), deep.predict(X)))
+
 def main():
     test_dt = TestDecisionTree()
     test_dt.test_predict()
+    test_dt.test_save_load()
 
 if __name__ == "__main__":
     main()
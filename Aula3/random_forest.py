@@ -0,0 +1,147 @@
+import os
+import sys
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from sklearn.metrics import accuracy_score
+from decision_tree import DecisionTree
+# shared_array está na pasta Aula2 (o caminho é relativo a este ficheiro, não à pasta de onde o script é executado)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Aula2'))
+from shared_array import _shared_X, _open_shared_X
+
+def _fit_tree(X, y, params, seed, bootstrap, oob_score):
+    # Treinar uma árvore numa amostra bootstrap de (X, y).
+    # Se oob_score for True devolve também as amostras fora da amostra bootstrap (out-of-bag) e as probabilidades previstas para elas
+    rng = np.random.default_rng(seed)
+    n_samples = X.shape[0]
+    if bootstrap:
+        indices = rng.integers(0, n_samples, n_samples)
+    else:
+        indices = np.arange(n_samples)
+    # a árvore lê as linhas da amostra diretamente de X (sem copiar a amostra bootstrap)
+    tree = DecisionTree(random_state=rng, **params).fit(X, y, indices)
+    oob = None
+    if oob_score and bootstrap:
+        oob_indices = np.flatnonzero(np.bincount(indices, minlength=n_samples) == 0)
+        oob = (oob_indices, tree.predict_proba(X[oob_indices]))
+    return tree, oob
+
+def _fit_shared_tree(X_ref, y, params, seed, bootstrap, oob_score):
+    # Executado num worker: abrir X (sem cópia) e treinar uma árvore
+    X = _open_shared_X(X_ref)
+    return _fit_tree(X, y, params, seed, bootstrap, oob_score)
+
+
+class RandomForest:
+    '''
+    Floresta aleatória: conjunto de DecisionTree treinadas em amostras bootstrap, com um subconjunto aleatório de features
+    candidatas em cada nó (max_features). A previsão é a média das probabilidades das árvores ('soft') ou a classe mais votada ('hard').
+
+    Argumentos:
+        - n_estimators : int -> número de árvores
+        - criterion, max_depth, min_samples_split, max_leaf_nodes, max_bins, min_impurity_decrease -> parâmetros de cada DecisionTree
+        - max_features -> features candidatas em cada nó: None (todas), int, fração (float), 'sqrt' ou 'log2'
+        - bootstrap : bool -> treinar cada árvore numa amostra com reposição (False usa todas as amostras)
+        - oob_score : bool -> calcular a exatidão out-of-bag (cada amostra é prevista só pelas árvores que não a usaram no treino)
+        - voting : str -> 'soft' (média das probabilidades) ou 'hard' (voto da classe prevista por cada árvore)
+        - n_jobs : int -> número de processos usados no treino (-1 usa todos os cores); os workers leem X de memória partilhada
+        - random_state -> semente do gerador aleatório (o resultado não depende de n_jobs)
+    Parâmetros estimados:
+        - classes_ : Array com as classes
+        - estimators_ : lista com as DecisionTree treinadas
+        - oob_decision_function_ : Array (amostras x classes) -> probabilidades out-of-bag de cada amostra de treino (NaN se não houver)
+        - oob_score_ : float -> exatidão out-of-bag
+    '''
+    def __init__(self, n_estimators=100, criterion='entropy', max_depth=None, min_samples_split=2, max_leaf_nodes=None,
+                 max_bins=None, min_impurity_decrease=0.0, max_features='sqrt', bootstrap=True, oob_score=False,
+                 voting='soft', n_jobs=1, random_state=None):
+        self.n_estimators = n_estimators
+        self.criterion = criterion
+        self.max_depth = max_depth
+        self.min_samples_split = min_samples_split
+        self.max_leaf_nodes = max_leaf_nodes
+        self.max_bins = max_bins
+        self.min_impurity_decrease = min_impurity_decrease
+        self.max_features = max_features
+        self.bootstrap = bootstrap
+        self.oob_score = oob_score
+        self.voting = voting
+        self.n_jobs = n_jobs
+        self.random_state = random_state
+
+    def fit(self, X, y):
+        if self.voting not in ('soft', 'hard'):
+            raise ValueError("Invalid voting: {}".format(self.voting))
+        if self.oob_score and not self.bootstrap:
+            raise ValueError("oob_score requires bootstrap=True")
+        # As classes são codificadas uma única vez: as árvores são treinadas com os códigos 0..n_classes-1
+        self.classes_, y = np.unique(y, return_inverse=True)
+        params = {'criterion': self.criterion, 'max_depth': self.max_depth, 'min_samples_split': self.min_samples_split,
+                  'max_leaf_nodes': self.max_leaf_nodes, 'max_bins': self.max_bins,
+                  'min_impurity_decrease': self.min_impurity_decrease, 'max_features': self.max_features}
+        # uma semente por árvore, tirada do gerador da floresta antes do treino
+        seeds = np.random.default_rng(self.random_state).integers(0, 2 ** 32, size=self.n_estimators)
+        n_jobs = os.cpu_count() if self.n_jobs == -1 else self.n_jobs
+        if n_jobs > 1 and self.n_estimators > 1:
+            # em ordem Fortran, a ordem em que a DecisionTree lê X (as árvores usam a matriz partilhada sem a copiar)
+            X_ref, tmp = _shared_X(X, 'F', 'random_forest_')
+            try:
+                with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+                    futures = [pool.submit(_fit_shared_tree, X_ref, y, params, seed, self.bootstrap, self.oob_score)
+                               for seed in seeds]
+                    results = [future.result() for future in futures]
+            finally:
+                if tmp is not None:
+                    os.unlink(tmp)
+        else:
+            # uma única cópia em ordem Fortran, partilhada por todas as árvores
+            X = np.asfortranarray(X)
+            results = [_fit_tree(X, y, params, seed, self.bootstrap, self.oob_score) for seed in seeds]
+        self.estimators_ = [tree for tree, _ in results]
+
+        if self.oob_score:
+            # Juntar as previsões out-of-bag calculadas nos workers com os índices bootstrap de cada árvore
+            votes = np.zeros((len(y), len(self.classes_)))
+            for tree, (oob_indices, proba) in results:
+                votes[oob_indices[:, None], tree.classes_] += self._tree_votes(proba)
+            totals = votes.sum(axis=1, keepdims=True)
+            with np.errstate(invalid='ignore'):
+                self.oob_decision_function_ = votes / totals
+            seen = totals[:, 0] > 0
+            self.oob_score_ = accuracy_score(y[seen], np.argmax(votes[seen], axis=1))
+        return self
+
+    def _tree_votes(self, proba):
+        # Contribuição de uma árvore: as probabilidades ('soft') ou um voto na classe mais provável ('hard')
+        if self.voting == 'soft':
+            return proba
+        votes = np.zeros(proba.shape)
+        votes[np.arange(len(proba)), np.argmax(proba, axis=1)] = 1
+        return votes
+
+    def predict_proba(self, X):
+        # Média das contribuições de todas as árvores; cada árvore prevê todas as amostras de uma vez (DecisionTree.apply)
+        X = np.asarray(X)
+        proba = np.zeros((X.shape[0], len(self.classes_)))
+        for tree in self.estimators_:
+            # as colunas de cada árvore são as classes presentes na sua amostra bootstrap (códigos das classes da floresta)
+            proba[:, tree.classes_] += self._tree_votes(tree.predict_proba(X))
+        return proba / len(self.estimators_)
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+
+if __name__ == '__main__':
+    # Comparar uma árvore com uma floresta num problema com features irrelevantes
+    rng = np.random.default_rng(0)
+    X = rng.random((2000, 10))
+    y = np.where(X[:, 0] + X[:, 1] + 0.3 * rng.standard_normal(2000) > 1, 'a', 'b')
+    X_train, X_test, y_train, y_test = X[:1500], X[1500:], y[:1500], y[1500:]
+
+    tree = DecisionTree(max_depth=10).fit(X_train, y_train)
+    print("Acurácia da árvore:", accuracy_score(y_test, tree.predict(X_test)))
+
+    forest = RandomForest(n_estimators=50, max_depth=10, oob_score=True, n_jobs=2, random_state=0).fit(X_train, y_train)
+    print("Acurácia da floresta:", accuracy_score(y_test, forest.predict(X_test)))
+    print("Acurácia out-of-bag:", forest.oob_score_)
+    print("Probabilidades das primeiras amostras:\n", forest.predict_proba(X_test[:3]))
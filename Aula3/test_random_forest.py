@@ -0,0 +1,19 @@
+import numpy as np
+
+from random_forest import RandomForest
+
+
+def test_parallel_fit_on_sliced_memmap(tmp_path):
+    # as árvores treinadas nos workers têm de ler as mesmas colunas da fatia do np.memmap que as treinadas em série
+    rng = np.random.default_rng(0)
+    X = rng.random((300, 4))
+    y = (X[:, 1] + X[:, 2] > 1).astype(int)
+    filename = str(tmp_path / 'X.npy')
+    np.save(filename, np.asfortranarray(X))
+    X_slice = np.load(filename, mmap_mode='r')[:, 1:3]
+    serial = RandomForest(n_estimators=4, max_depth=3, n_jobs=1, random_state=0).fit(X_slice, y)
+    parallel = RandomForest(n_estimators=4, max_depth=3, n_jobs=2, random_state=0).fit(X_slice, y)
+    for a, b in zip(serial.estimators_, parallel.estimators_):
+        np.testing.assert_array_equal(a.feature_, b.feature_)
+        np.testing.assert_array_equal(a.threshold_, b.threshold_)
+    np.testing.assert_array_equal(serial.predict_proba(X[:, 1:3]), parallel.predict_proba(X[:, 1:3]))
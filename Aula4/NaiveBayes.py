@@ -1,40 +1,285 @@
 import numpy as np
+import os
+import sys
+import scipy.sparse as sp
+from scipy.special import logsumexp
+# f_classif está na pasta Aula2 (o caminho é relativo a este ficheiro, não à pasta de onde o script é executado)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Aula2'))
+from f_classif import AnovaStats, chunk_rows
 
 class NaiveBayes:
+    '''
+    Naive Bayes gaussiano. A previsão é feita em espaço logarítmico (sem underflow com muitas features),
+    para todas as classes de uma vez e em blocos de linhas (memória limitada).
+
+    Argumentos:
+        - var_smoothing : float -> fração da maior variância das features somada a todas as variâncias (evita divisões por zero)
+        - chunksize : int -> número de linhas processadas de cada vez na previsão (por omissão ~8M valores por bloco)
+        - dtype -> tipo usado na previsão (np.float32 usa metade da memória; nesse caso os desvios (x - média) são calculados
+                   diretamente para cada classe, porque a forma expandida perde a precisão toda em float32)
+    Parâmetros estimados:
+        - classes, priors, means, stds : classes, probabilidades a priori, médias e desvios padrão de cada classe
+        - epsilon : float -> valor somado às variâncias
+        - stats_ : AnovaStats -> contagens, médias e M2 de cada classe acumulados pelo partial_fit (podem ser juntos com merge)
+    '''
     # Inicializa as variáveis de classe
-    def __init__(self):
+    def __init__(self, var_smoothing=1e-9, chunksize=None, dtype=np.float64):
+        self.var_smoothing = var_smoothing
+        self.chunksize = chunksize
+        self.dtype = dtype
         self.classes = None
         self.priors = None
         self.means = None
         self.stds = None
+        self.stats_ = None
+        self._declared = None
 
     # Calcula as probabilidades, médias e desvios padrão anteriores para cada classe
     def fit(self, X, y):
-        self.classes = np.unique(y)
-        self.priors = np.zeros(len(self.classes))
-        self.means = np.zeros((len(self.classes), X.shape[1]))
-        self.stds = np.zeros((len(self.classes), X.shape[1]))
-
-        for i, c in enumerate(self.classes):
-            X_c = X[y == c]
-            self.priors[i] = X_c.shape[0] / float(X.shape[0])
-            self.means[i, :] = X_c.mean(axis=0)
-            self.stds[i, :] = X_c.std(axis=0)
-    # Calcula as probabilidades posteriores para cada classe e retorna a classe com a maior probabilidade       
+        self.stats_ = None
+        self._declared = None
+        return self.partial_fit(X, y)
+
+    def partial_fit(self, X_chunk, y_chunk, classes=None):
+        # Acumular um bloco (X_chunk, y_chunk): as somas por classe são calculadas numa única passagem (matriz one-hot x bloco)
+        # e juntas ao estado anterior com a fórmula de Chan, por isso o custo só depende do tamanho do bloco.
+        # 'classes' permite declarar classes que ainda não apareceram (ficam com probabilidade a priori 0)
+        y_chunk = np.asarray(y_chunk)
+        if classes is not None:
+            classes = np.unique(classes)
+            if not np.isin(y_chunk, classes).all():
+                raise ValueError('y_chunk tem classes que não estão em classes.')
+            self._declared = classes if self._declared is None else np.union1d(self._declared, classes)
+        if self.stats_ is None:
+            self.stats_ = AnovaStats(self.chunksize)
+        if len(y_chunk):
+            self.stats_.update(X_chunk, y_chunk)
+        self._finalize()
+        return self
+
+    def merge(self, other):
+        # Juntar o estado de outro NaiveBayes (p.ex. treinado noutro processo com outra parte dos dados)
+        if other._declared is not None:
+            self._declared = other._declared if self._declared is None else np.union1d(self._declared, other._declared)
+        if other.stats_ is not None:
+            if self.stats_ is None:
+                self.stats_ = AnovaStats(self.chunksize)
+            self.stats_.merge(other.stats_)
+        self._finalize()
+        return self
+
+    def _finalize(self):
+        # Probabilidades a priori, médias e desvios padrão a partir das estatísticas acumuladas
+        stats = self.stats_
+        if stats is None or stats.classes is None:
+            return
+        classes, counts, means, m2 = stats.classes, stats.counts, stats.means, stats.m2
+        if self._declared is not None:
+            # classes declaradas mas ainda sem amostras: contagem 0
+            all_classes = np.union1d(classes, self._declared)
+            idx = np.searchsorted(all_classes, classes)
+            counts_full = np.zeros(len(all_classes), dtype=np.int64)
+            means_full = np.zeros((len(all_classes), means.shape[1]))
+            m2_full = np.zeros((len(all_classes), means.shape[1]))
+            counts_full[idx], means_full[idx], m2_full[idx] = counts, means, m2
+            classes, counts, means, m2 = all_classes, counts_full, means_full, m2_full
+        n = counts.sum()
+        self.classes = classes
+        self.priors = counts / n
+        self.means = means
+        self.stds = np.sqrt(np.divide(m2, counts[:, None], out=np.zeros(m2.shape), where=counts[:, None] > 0))
+        # variância de cada feature em todos os dados: variância dentro das classes + variância entre as classes
+        grand_mean = (self.priors[:, None] * means).sum(axis=0)
+        total_var = (m2.sum(axis=0) + (counts[:, None] * (means - grand_mean) ** 2).sum(axis=0)) / n
+        self.epsilon = self.var_smoothing * total_var.max()
+        self._prepare()
+
+    def _prepare(self):
+        # Pré-calcular os termos da log-verosimilhança que só dependem dos parâmetros:
+        # log N(x | m, v) somado nas features = c - 0.5 * (x^2 . 1/v) + x . (m/v), com c = log(prior) - 0.5 * sum(log(2 pi v) + m^2/v).
+        # X e as médias são deslocados pela média global para reduzir o cancelamento numérico dos produtos
+        var = self.stds ** 2 + (self.epsilon if self.epsilon > 0 else self.var_smoothing)
+        self._shift = (self.priors[:, None] * self.means).sum(axis=0)
+        means = self.means - self._shift
+        inv_var = 1 / var
+        with np.errstate(divide='ignore'):
+            log_prior = np.log(self.priors)
+        self._const = (log_prior - 0.5 * (np.log(2 * np.pi * var) + means ** 2 * inv_var).sum(axis=1)).astype(self.dtype)
+        self._quad = (-0.5 * inv_var).T.astype(self.dtype)
+        self._lin = (means * inv_var).T.astype(self.dtype)
+        # forma direta (usada com dtype != float64): c' = log(prior) - 0.5 * sum(log(2 pi v)), somado a -0.5 * (x - m)^2 / v
+        self._norm = (log_prior - 0.5 * np.log(2 * np.pi * var).sum(axis=1)).astype(self.dtype)
+        self._means = self.means.astype(self.dtype)
+
+    def _joint_log_likelihood(self, X):
+        # log(prior * verosimilhança) de cada classe, bloco a bloco: dois produtos de matrizes por bloco (linhas x classes)
+        if np.dtype(self.dtype) != np.float64:
+            yield from self._direct_log_likelihood(X)
+            return
+        chunksize = chunk_rows(X.shape[1], self.chunksize)
+        shift = self._shift.astype(self.dtype)
+        for start in range(0, X.shape[0], chunksize):
+            block = np.asarray(X[start:start + chunksize], dtype=self.dtype) - shift
+            yield self._const + (block * block) @ self._quad + block @ self._lin
+
+    def _direct_log_likelihood(self, X):
+        # Forma direta para tipos com menos precisão: os desvios de cada linha à média de cada classe (linhas x classes x features)
+        # não sofrem o cancelamento entre x^2 / v e x * m / v; os blocos têm menos linhas para o tamanho em memória ser o mesmo
+        chunksize = chunk_rows(X.shape[1] * len(self.classes), self.chunksize)
+        for start in range(0, X.shape[0], chunksize):
+            block = np.asarray(X[start:start + chunksize], dtype=self.dtype)
+            diff = block[:, None, :] - self._means
+            yield self._norm + np.einsum('ncf,fc->nc', diff * diff, self._quad)
+
+    # Calcula as probabilidades posteriores para cada classe e retorna a classe com a maior probabilidade
+    def predict(self, X):
+        if X.shape[0] == 0:
+            return self.classes[:0]
+        return np.concatenate([self.classes[np.argmax(jll, axis=1)] for jll in self._joint_log_likelihood(X)])
+
+    def predict_log_proba(self, X):
+        # Logaritmo das probabilidades posteriores (colunas pela ordem de classes), normalizadas com log-sum-exp
+        blocks = [jll - logsumexp(jll, axis=1, keepdims=True) for jll in self._joint_log_likelihood(X)]
+        return np.concatenate(blocks) if blocks else np.empty((0, len(self.classes)), dtype=self.dtype)
+
+    def predict_proba(self, X):
+        return np.exp(self.predict_log_proba(X))
+
+
+class _DiscreteNaiveBayes:
+    '''
+    Base dos Naive Bayes para contagens (multinomial) e presenças (Bernoulli).
+    X pode ser uma matriz esparsa scipy.sparse (CSR) e nunca é convertida para densa: o fit é um produto esparso
+    (one-hot das classes transposta x X) e a previsão um produto esparso x denso, a memória é proporcional aos valores não nulos.
+    As contagens são somas, por isso podem ser acumuladas com partial_fit e juntas com merge.
+    As subclasses definem _update_feature_log_prob (probabilidades a partir das contagens) e _joint_log_likelihood (previsão).
+
+    Argumentos:
+        - alpha : float -> suavização de Laplace (somada a todas as contagens)
+    Parâmetros estimados:
+        - classes : Array com as classes
+        - class_count : Array (classes) -> número de amostras de cada classe
+        - feature_count : Array (classes x features) -> soma dos valores de cada feature em cada classe
+        - class_log_prior, feature_log_prob : logaritmos das probabilidades a priori e das probabilidades de cada feature por classe
+    '''
+    def __init__(self, alpha=1.0):
+        self.alpha = alpha
+        self.classes = None
+        self.class_count = None
+        self.feature_count = None
+
+    def _transform(self, X):
+        return X
+
+    def fit(self, X, y):
+        self.classes = None
+        return self.partial_fit(X, y)
+
+    def partial_fit(self, X_chunk, y_chunk, classes=None):
+        # Somar as contagens de um bloco: matriz one-hot esparsa (classes x amostras) multiplicada pelo bloco
+        X_chunk = self._transform(X_chunk)
+        chunk_classes, codes = np.unique(y_chunk, return_inverse=True)
+        onehot = sp.csr_matrix((np.ones(len(codes)), (codes, np.arange(len(codes)))), shape=(len(chunk_classes), len(codes)))
+        feature_count = onehot @ X_chunk
+        feature_count = feature_count.toarray() if sp.issparse(feature_count) else np.asarray(feature_count)
+        class_count = np.bincount(codes, minlength=len(chunk_classes)).astype(np.float64)
+        if classes is not None:
+            # classes declaradas que ainda não apareceram ficam com contagem 0
+            classes = np.unique(classes)
+            if not np.isin(chunk_classes, classes).all():
+                raise ValueError('y_chunk tem classes que não estão em classes.')
+            idx = np.searchsorted(classes, chunk_classes)
+            class_count, counts = np.zeros(len(classes)), class_count
+            class_count[idx] = counts
+            feature_count, counts = np.zeros((len(classes), feature_count.shape[1])), feature_count
+            feature_count[idx] = counts
+            chunk_classes = classes
+        return self._add(chunk_classes, class_count, feature_count)
+
+    def merge(self, other):
+        # Juntar as contagens de outro modelo do mesmo tipo (p.ex. treinado noutro processo)
+        if other.classes is None:
+            return self
+        return self._add(other.classes, other.class_count, other.feature_count)
+
+    def _add(self, classes, class_count, feature_count):
+        if self.classes is not None:
+            # alinhar as classes dos dois estados (uma classe que falte num deles tem contagem 0)
+            all_classes = np.union1d(self.classes, classes)
+            total_class = np.zeros(len(all_classes))
+            total_feature = np.zeros((len(all_classes), feature_count.shape[1]))
+            for c, cc, fc in ((self.classes, self.class_count, self.feature_count), (classes, class_count, feature_count)):
+                idx = np.searchsorted(all_classes, c)
+                total_class[idx] += cc
+                total_feature[idx] += fc
+            classes, class_count, feature_count = all_classes, total_class, total_feature
+        self.classes, self.class_count, self.feature_count = classes, class_count, feature_count
+        with np.errstate(divide='ignore'):
+            self.class_log_prior = np.log(class_count) - np.log(class_count.sum())
+        self._update_feature_log_prob()
+        return self
+
     def predict(self, X):
-      n_samples = X.shape[0]
-      n_classes = len(self.classes)
-      probs = np.zeros((n_samples, n_classes))
-      
-      for i in range(n_classes):
-          prior = self.priors[i]
-          likelihood = 1 / np.sqrt(2 * np.pi * self.stds[i]**2) * np.exp(-(X - self.means[i])**2 / (2 * self.stds[i]**2))
-          total_likelihood = np.prod(likelihood, axis=1)
-          posterior = prior * total_likelihood
-          probs[:, i] = posterior
-      
-      y_pred = self.classes[np.argmax(probs, axis=1)]
-      return y_pred
+        return self.classes[np.argmax(self._joint_log_likelihood(X), axis=1)]
+
+    def predict_log_proba(self, X):
+        jll = self._joint_log_likelihood(X)
+        return jll - logsumexp(jll, axis=1, keepdims=True)
+
+    def predict_proba(self, X):
+        return np.exp(self.predict_log_proba(X))
+
+
+class MultinomialNaiveBayes(_DiscreteNaiveBayes):
+    '''
+    Naive Bayes multinomial para contagens (p.ex. número de ocorrências de cada palavra ou evento).
+    P(feature | classe) = (contagem da feature na classe + alpha) / (total da classe + alpha * n_features)
+    '''
+    def _update_feature_log_prob(self):
+        smoothed = self.feature_count + self.alpha
+        self.feature_log_prob = np.log(smoothed) - np.log(smoothed.sum(axis=1, keepdims=True))
+
+    def _joint_log_likelihood(self, X):
+        # um único produto (esparso x denso): amostras x classes
+        return np.asarray(X @ self.feature_log_prob.T) + self.class_log_prior
+
+
+class BernoulliNaiveBayes(_DiscreteNaiveBayes):
+    '''
+    Naive Bayes de Bernoulli para presenças/ausências: cada valor maior do que 'binarize' conta como presença.
+    P(feature | classe) = (amostras da classe com a feature + alpha) / (amostras da classe + 2 * alpha)
+
+    Argumentos:
+        - binarize : float -> limite para considerar uma feature presente (None se X já for binária); deve ser >= 0
+                              para que os zeros de uma matriz esparsa continuem a ser ausências
+    '''
+    def __init__(self, alpha=1.0, binarize=0.0):
+        super().__init__(alpha)
+        self.binarize = binarize
+
+    def _transform(self, X):
+        # binarizar só os valores guardados: uma matriz esparsa continua esparsa
+        if self.binarize is None:
+            return X
+        if sp.issparse(X):
+            X = sp.csr_matrix(X, copy=True)
+            X.data = (X.data > self.binarize).astype(np.float64)
+            X.eliminate_zeros()
+            return X
+        return (np.asarray(X) > self.binarize).astype(np.float64)
+
+    def _update_feature_log_prob(self):
+        smoothed = self.feature_count + self.alpha
+        denominator = np.log(self.class_count + 2 * self.alpha)[:, None]
+        self.feature_log_prob = np.log(smoothed) - denominator
+        self._neg_log_prob = np.log(self.class_count[:, None] + 2 * self.alpha - smoothed) - denominator
+
+    def _joint_log_likelihood(self, X):
+        # log P = sum(x * log p + (1 - x) * log(1 - p)) = x . (log p - log(1 - p)) + sum(log(1 - p)):
+        # só os valores não nulos de X entram no produto, a parte das ausências é uma constante por classe
+        X = self._transform(X)
+        delta = (self.feature_log_prob - self._neg_log_prob).T
+        return np.asarray(X @ delta) + self._neg_log_prob.sum(axis=1) + self.class_log_prior
 
 from sklearn import datasets
 from sklearn.model_selection import train_test_split
@@ -57,6 +302,13 @@ for i in range(n_tests):
 
 print('Average accuracy:', np.mean(accuracy))
 
+# O mesmo modelo treinado em dois blocos por dois NaiveBayes diferentes e depois juntos (partial_fit + merge)
+X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2)
+nb_a = NaiveBayes().partial_fit(X_train[:60], y_train[:60], classes=np.unique(y))
+nb_b = NaiveBayes().partial_fit(X_train[60:], y_train[60:])
+nb_a.merge(nb_b)
+print('Accuracy partial_fit + merge:', accuracy_score(y_test, nb_a.predict(X_test)))
+
 from sklearn.naive_bayes import GaussianNB
 iris = datasets.load_iris()
 X = iris.data
@@ -71,4 +323,15 @@ for i in range(n_tests):
     y_pred = nb.predict(X_test)
     accuracy[i] = accuracy_score(y_test, y_pred)
 
-print('Average accuracy Sklearn:', np.mean(accuracy))
\ No newline at end of file
+print('Average accuracy Sklearn:', np.mean(accuracy))
+
+# Variantes para contagens esparsas (p.ex. texto): a matriz CSR nunca é convertida para densa
+from sklearn.naive_bayes import MultinomialNB, BernoulliNB
+rng = np.random.default_rng(0)
+X_counts = sp.random(2000, 50000, density=0.001, format='csr', random_state=0, data_rvs=lambda n: rng.integers(1, 5, n))
+y_counts = rng.integers(0, 3, 2000)
+X_counts = X_counts + sp.csr_matrix((np.full(2000, 3.0), (np.arange(2000), y_counts)), shape=X_counts.shape)
+for ours, theirs in ((MultinomialNaiveBayes(), MultinomialNB()), (BernoulliNaiveBayes(), BernoulliNB())):
+    ours.fit(X_counts, y_counts)
+    theirs.fit(X_counts, y_counts)
+    print(type(ours).__name__, 'igual ao sklearn:', np.allclose(ours.predict_log_proba(X_counts), theirs.predict_log_proba(X_counts)))
@@ -1,77 +1,131 @@
+import numpy as np
+import pandas as pd
+
+# Número de bits a 1 em cada byte (usado quando o numpy não tem np.bitwise_count)
+_BYTE_COUNTS = np.array([bin(i).count('1') for i in range(256)], dtype=np.int64)
+
+def _pack(masks):
+    # Empacotar máscaras booleanas (uma por linha) em bitsets de palavras de 64 bits (a última palavra é completada com zeros)
+    packed = np.packbits(np.atleast_2d(masks), axis=1)
+    padding = -packed.shape[1] % 8
+    if padding:
+        packed = np.pad(packed, ((0, 0), (0, padding)))
+    return np.ascontiguousarray(packed).view(np.uint64)
+
+def _popcount(words):
+    # Número de bits a 1 de cada bitset (soma na última dimensão)
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(words).sum(axis=-1, dtype=np.int64)
+    return _BYTE_COUNTS[words.view(np.uint8)].sum(axis=-1)
+
+def _first_row(words):
+    # Índice da primeira instância (bit a 1) de um bitset
+    i = np.argmax(words != 0)
+    return i * 64 + np.argmax(np.unpackbits(words[i:i + 1].view(np.uint8)))
+
+def _rule(feature, value):
+    # Regra 'feature == value' (as variáveis ficam no closure da lambda, usado pelo __repr__)
+    return lambda x: x[feature] == value
+
 class Prism:
+    '''
+    Classificador Prism: induz regras 'feature == valor' para a classe mais comum das instâncias ainda não cobertas.
+    As instâncias cobertas por cada par (feature, valor) e as de cada classe são guardadas como bitsets:
+    a cobertura e a precisão de todas as regras candidatas são calculadas com AND + contagem de bits
+    e as instâncias cobertas pela regra escolhida são removidas com AND-NOT, sem copiar o DataFrame.
+    Em caso de empate fica a regra da primeira feature e, nessa feature, do valor que aparece primeiro nas instâncias restantes.
+
+    Argumentos:
+        - data : DataFrame -> features
+        - target : Series -> classes
+    Parâmetros estimados:
+        - rules : lista de regras (funções x -> x[feature] == value)
+        - rule_classes_ : classe prevista por cada regra (a mais frequente nas instâncias de treino cobertas)
+    '''
     def __init__(self, data, target):
         self.data = data
         self.target = target
         self.rules = []
-    
+
+    def _build_index(self, data, target, block_size=1 << 26):
+        # Um bitset por par (feature, valor) e um por classe; as máscaras são criadas em blocos de valores (memória limitada)
+        n = len(data)
+        self._pairs, self._pair_features, bitsets = [], [], []
+        for j, feature in enumerate(data.columns):
+            codes, uniques = pd.factorize(data[feature])
+            step = max(1, block_size // max(n, 1))
+            for start in range(0, len(uniques), step):
+                values = np.arange(start, min(start + step, len(uniques)))
+                bitsets.append(_pack(codes[None, :] == values[:, None]))
+            self._pairs += [(feature, value) for value in uniques]
+            self._pair_features += [j] * len(uniques)
+        n_words = -(-n // 64)
+        self._features_index = np.concatenate(bitsets) if bitsets else np.zeros((0, n_words), dtype=np.uint64)
+        self._pair_features = np.array(self._pair_features, dtype=np.intp)
+        # classes ordenadas (como o mode() do pandas em caso de empate)
+        self.classes_, class_codes = np.unique(np.asarray(target), return_inverse=True)
+        self._classes_index = _pack(class_codes[None, :] == np.arange(len(self.classes_))[:, None])
+
     def fit(self):
-      data = self.data.copy()
-      target = self.target.copy()
-      
-      while len(data) > 0:
-          # Encontra a classe mais commum
-          most_common_class = target.value_counts().idxmax()
-          
+      self._build_index(self.data, self.target)
+      self.rules = []
+      self.rule_classes_ = []
+      # bitset das instâncias ainda não cobertas
+      remaining = _pack(np.ones(len(self.data), dtype=bool))[0]
+
+      while _popcount(remaining) > 0:
+          # Encontra a classe mais commum (em caso de empate a que aparece primeiro, como o value_counts().idxmax())
+          class_counts = _popcount(self._classes_index & remaining)
+          tied = np.flatnonzero(class_counts == class_counts.max())
+          most_common_class = min(tied, key=lambda c: _first_row(self._classes_index[c] & remaining))
+
           # Encontra a melhor regra para a classe mais comum
-          best_rule = self.find_best_rule(data, target, most_common_class)
-          
+          best = self.find_best_rule(remaining, most_common_class)
+          feature, value = self._pairs[best]
+
           # Adiciona a melhor regra à lista de regras
-          self.rules.append(best_rule)
-          
-          # Remove instâncias abrangidas pela melhor regra
-          data = data[~best_rule(data)]
-          target = target.loc[data.index]
-
-    # Encontra a melhor regra para uma certa classe
-    def find_best_rule(self, data, target, most_common_class):
-        best_accuracy = 0
-        best_rule = None
-        
-        # Itera sobre todos as features
-        for feature in data.columns:
-            # Itera apenas os únicos
-            for value in data[feature].unique():
-                # Cria uma regra que seleciona as instâncias
-                rule = lambda x: x[feature] == value
-                
-                # Calcula a precisão da regra
-                accuracy = (target[rule(data)] == most_common_class).mean()
-                
-                # Atualiza a melhor regra
-                if accuracy > best_accuracy:
-                    best_accuracy = accuracy
-                    best_rule = rule
-        
-        return best_rule
+          self.rules.append(_rule(feature, value))
+          class_counts = _popcount(self._features_index[best] & self._classes_index)
+          self.rule_classes_.append(self.classes_[np.argmax(class_counts)])
+
+          # Remove instâncias abrangidas pela melhor regra (AND-NOT no bitset)
+          remaining = remaining & ~self._features_index[best]
+      return self
+
+    # Encontra a melhor regra para uma certa classe: índice do par (feature, valor) com maior precisão nas instâncias restantes
+    def find_best_rule(self, remaining, most_common_class):
+        covered = self._features_index & remaining
+        coverage = _popcount(covered)
+        hits = _popcount(covered & self._classes_index[most_common_class])
+        # precisão de todas as regras candidatas de uma vez (só contam as regras que cobrem alguma instância)
+        accuracy = np.divide(hits, coverage, out=np.zeros(len(hits)), where=coverage > 0)
+        tied = np.flatnonzero(accuracy == accuracy.max())
+        # empate: primeira feature e, nessa feature, o valor que aparece primeiro nas instâncias restantes
+        tied = tied[self._pair_features[tied] == self._pair_features[tied].min()]
+        return min(tied, key=lambda k: _first_row(covered[k]))
+
     def predict(self, data):
-      predictions = []
-      
-      # Itera sobre todas as instâncias
-      for i in range(len(data)):
-          instance = data.iloc[i]
-          
-          # Itera todas as regras
-          for rule in self.rules:
-              # Verifiqua se a instância está coberta pela regra
-              if rule(instance.to_frame().T).any():
-                  predictions.append(self.target[rule(self.data)].mode()[0])
-                  break
-      
-      return predictions
+      # A previsão de cada instância é a classe da primeira regra que a cobre (None se nenhuma regra a cobrir);
+      # cada regra é avaliada uma única vez em todas as instâncias ainda sem previsão
+      predictions = np.full(len(data), None, dtype=object)
+      pending = np.ones(len(data), dtype=bool)
+      for rule, class_label in zip(self.rules, self.rule_classes_):
+          covered = pending & np.asarray(rule(data))
+          predictions[covered] = class_label
+          pending &= ~covered
+      return list(predictions)
 
 
     # Print das regras
     def __repr__(self):
       rules_str = []
-      for i, rule in enumerate(self.rules):
+      for i, (rule, class_label) in enumerate(zip(self.rules, self.rule_classes_)):
           feature = rule.__closure__[0].cell_contents
           value = rule.__closure__[1].cell_contents
-          class_label = self.target[rule(self.data)].mode()[0]
           rules_str.append(f'Rule {i + 1}: If {feature} == {value}, then class = {class_label}')
       return '\n'.join(rules_str)
 
 
-import pandas as pd
 from sklearn.datasets import load_iris
 
 iris = load_iris()